@@ -1,45 +1,238 @@
 import streamlit as st
 import os
-from dotenv import load_dotenv
-from src.personalities import PERSONALITIES, get_system_prompt
-
-# Load environment variables
-load_dotenv()
-
-# Initialize Groq client - with fallback to demo mode
-@st.cache_resource
-def get_groq_client():
-    api_key = os.getenv("GROQ_API_KEY")
+import uuid
+from src.personalities import PromptRegistry
+from src.preflight import PREFLIGHT_STATS, parse_speculation_policy
+from src.models import DEFAULT_MODEL, MODEL_OPTIONS
+from src.cache import ResponseCache, create_response_cache
+from src.coalesce import create_request_coalescer
+from src.engine import BackgroundLoop, ChatEngine
+from src.fanout import CHUNK, ERROR, select_personalities
+from src.metrics import METRICS, RequestProfiler, start_metrics_server, start_snapshot_writer
+from src.client_pool import GroqClientPool
+from src.rendering import StreamRenderer
+from src.router import AUTO_MODEL
+from src.store import ConversationStore
+from src.shared_state import create_shared_state
+from src.summary import create_conversation_summarizer
+
+# Load environment variables once per process instead of on every rerun
+# (no spinner: set_page_config must stay the first Streamlit command)
+@st.cache_resource(show_spinner=False)
+def load_environment():
+    from dotenv import load_dotenv
+    load_dotenv()
+
+load_environment()
+
+# Streaming render cadence
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL_MS", "50")) / 1000
+STREAM_FLUSH_CHUNKS = int(os.getenv("STREAM_FLUSH_CHUNKS", "20"))
+
+# Fan-out mode: cap on concurrent Groq streams per question and on auto-picked personas
+FANOUT_MAX_CONCURRENCY = int(os.getenv("FANOUT_MAX_CONCURRENCY", "3"))
+FANOUT_MAX_PERSONALITIES = int(os.getenv("FANOUT_MAX_PERSONALITIES", "3"))
+
+# Collect Groq API keys from GROQ_API_KEYS (comma-separated) or GROQ_API_KEY
+def get_api_keys():
+    keys = os.getenv("GROQ_API_KEYS") or os.getenv("GROQ_API_KEY")
 
     # For Streamlit Cloud, check st.secrets
-    if not api_key:
+    if not keys:
         try:
-            api_key = st.secrets.get("GROQ_API_KEY")
+            keys = st.secrets.get("GROQ_API_KEYS") or st.secrets.get("GROQ_API_KEY")
         except:
             pass
 
-    if not api_key or api_key == "your_groq_api_key_here":
+    if isinstance(keys, str):
+        keys = keys.split(",")
+    keys = [key.strip() for key in keys or []]
+    return [key for key in keys if key and key != "your_groq_api_key_here"]
+
+# Process-wide metrics; off unless METRICS_ENABLED, METRICS_PORT or METRICS_SNAPSHOT_PATH is set
+@st.cache_resource
+def get_metrics():
+    port = os.getenv("METRICS_PORT")
+    snapshot_path = os.getenv("METRICS_SNAPSHOT_PATH")
+    METRICS.enabled = os.getenv("METRICS_ENABLED", "0") == "1" or bool(port) or bool(snapshot_path)
+    if port:
+        start_metrics_server(METRICS, os.getenv("METRICS_HOST", "127.0.0.1"), int(port))
+    if snapshot_path:
+        start_snapshot_writer(METRICS, snapshot_path, float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "15")))
+    return METRICS
+
+# Profile a sample of requests when PROFILE_SAMPLE_RATE is set
+@st.cache_resource
+def get_request_profiler():
+    sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    if sample_rate <= 0:
         return None
+    return RequestProfiler(sample_rate, os.getenv("PROFILE_DIR", "profiles"), os.getenv("PROFILER", "cprofile"))
+
+# State shared by every replica of the app (history, response cache, rate limits) when SHARED_STATE_URL is set
+@st.cache_resource
+def get_shared_state():
+    return create_shared_state(os.getenv("SHARED_STATE_URL"))
 
+# Initialize Groq client pool - with fallback to demo mode
+@st.cache_resource
+def get_groq_client():
+    api_keys = get_api_keys()
+    if not api_keys:
+        return None
+
+    shared_state = get_shared_state()
     try:
-        from groq import Groq
-        # Initialize without proxies parameter to avoid compatibility issues
-        client = Groq(api_key=api_key)
-        return client
+        return GroqClientPool(
+            api_keys,
+            requests_per_minute=float(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30")),
+            tokens_per_minute=float(os.getenv("GROQ_TOKENS_PER_MINUTE", "6000")),
+            # Rate-limit budgets drawn from by every replica
+            limiter_factory=shared_state.limiter_factory if shared_state is not None else None
+        )
     except Exception as e:
         # Log error but don't crash - let app run in demo mode
         return None
 
+# Create the Groq clients (groq/httpx imports included); a failure is kept in client.connect_error for the sidebar
+def connect_groq_client(client, metrics):
+    try:
+        with metrics.time("chat_client_init_seconds"):
+            client.connect()
+    except Exception:
+        pass
+
+# Shared response cache - on disk when RESPONSE_CACHE_PATH is set, shared by replicas with SHARED_STATE_URL
+@st.cache_resource
+def get_response_cache():
+    shared_state = get_shared_state()
+    if shared_state is not None:
+        return ResponseCache(shared_state.cache_backend(
+            max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1000")),
+            ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+        ))
+    return create_response_cache(
+        path=os.getenv("RESPONSE_CACHE_PATH"),
+        max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1000")),
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+    )
+
+# Event loop shared by all sessions in this process
+@st.cache_resource
+def get_background_loop():
+    return BackgroundLoop()
+
+# Append-only conversation log shared by all sessions in this process
+@st.cache_resource
+def get_conversation_store():
+    shared_state = get_shared_state()
+    if shared_state is not None:
+        return shared_state.conversation_store(window=int(os.getenv("CONVERSATION_WINDOW", "50")))
+    return ConversationStore(
+        path=os.getenv("CONVERSATION_DB_PATH", "conversations.db"),
+        window=int(os.getenv("CONVERSATION_WINDOW", "50"))
+    )
+
+# Compiled system prompts, plus personalities loaded from PERSONALITIES_DIR
+@st.cache_resource
+def get_prompt_registry():
+    return PromptRegistry(directory=os.getenv("PERSONALITIES_DIR") or None)
+
+# Optional semantic domain classifier for the pre-flight gate
+@st.cache_resource
+def get_semantic_classifier():
+    if os.getenv("SEMANTIC_CLASSIFIER", "0") != "1":
+        return None
+    try:
+        from src.semantic import load_or_build_classifier
+    except ImportError:
+        return None
+    return load_or_build_classifier(
+        get_prompt_registry().personalities,
+        os.getenv("SEMANTIC_INDEX_DIR", ".semantic_index")
+    )
+
+# Chat engine shared by all sessions in this process
+@st.cache_resource
+def get_chat_engine():
+    return ChatEngine(
+        get_groq_client(),
+        registry=get_prompt_registry(),
+        response_cache=get_response_cache(),
+        store=get_conversation_store(),
+        classifier=get_semantic_classifier(),
+        # Identical prompts arriving within this many seconds share one Groq stream
+        coalescer=create_request_coalescer(float(os.getenv("COALESCE_WINDOW", "2"))),
+        metrics=get_metrics(),
+        profiler=get_request_profiler(),
+        # Past this many unsummarized history tokens, older turns are folded into a rolling summary
+        summarizer=create_conversation_summarizer(
+            get_groq_client(),
+            int(os.getenv("SUMMARY_THRESHOLD_TOKENS", "1500")),
+            model=os.getenv("SUMMARY_MODEL", DEFAULT_MODEL),
+            keep_recent=int(os.getenv("SUMMARY_KEEP_RECENT", "6"))
+        ),
+        # Personalities whose pre-flight check runs while their Groq request is already streaming
+        speculative=parse_speculation_policy(os.getenv("PREFLIGHT_SPECULATIVE"))
+    )
+
 # Initialize session state
 def initialize_session():
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
+    if "session_id" not in st.session_state:
+        # Resume the session named in the URL, or start a new one
+        session_ids = st.experimental_get_query_params().get("session")
+        st.session_state.session_id = session_ids[0] if session_ids else uuid.uuid4().hex
+        st.experimental_set_query_params(session=st.session_state.session_id)
+    if "older_messages" not in st.session_state:
+        st.session_state.older_messages = []
     if "selected_personality" not in st.session_state:
         st.session_state.selected_personality = "Math Teacher"
     if "selected_model" not in st.session_state:
-        st.session_state.selected_model = "llama-3.1-8b-instant"
+        st.session_state.selected_model = DEFAULT_MODEL
     if "api_available" not in st.session_state:
         st.session_state.api_available = False
+    if "preflight_enabled" not in st.session_state:
+        st.session_state.preflight_enabled = False
+    if "last_render_stats" not in st.session_state:
+        st.session_state.last_render_stats = None
+    if "fan_out_enabled" not in st.session_state:
+        st.session_state.fan_out_enabled = False
+    if "fan_out_personalities" not in st.session_state:
+        st.session_state.fan_out_personalities = []
+
+# Stream several personas' answers side by side, one column each
+def render_fan_out(engine, loop, session_id, prompt, container):
+    personalities = st.session_state.fan_out_personalities or select_personalities(
+        prompt,
+        get_prompt_registry().personalities,
+        limit=FANOUT_MAX_PERSONALITIES,
+        fallback=st.session_state.selected_personality,
+        classifier=get_semantic_classifier()
+    )
+    renderers = {}
+    for column, name in zip(container.columns(len(personalities)), personalities):
+        column.markdown(f"**{name}**")
+        renderers[name] = StreamRenderer(
+            column.container(),
+            min_interval=STREAM_FLUSH_INTERVAL,
+            max_pending_chunks=STREAM_FLUSH_CHUNKS
+        )
+
+    events = engine.stream_fan_out(
+        session_id,
+        prompt,
+        personalities,
+        st.session_state.selected_model,
+        max_concurrency=FANOUT_MAX_CONCURRENCY,
+        preflight=st.session_state.preflight_enabled
+    )
+    for event, name, value in loop.iterate(events):
+        if event == CHUNK:
+            renderers[name].write(value)
+        elif event == ERROR:
+            renderers[name].write(f"\n\n❌ Error ({type(value).__name__}): {value}")
+    for renderer in renderers.values():
+        renderer.finish()
 
 # Streamlit page configuration
 st.set_page_config(
@@ -49,7 +242,12 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-st.markdown("""
+# Static UI pieces, built once per process
+@st.cache_resource
+def get_static_ui():
+    model_options = {**MODEL_OPTIONS, "Auto (fastest available)": AUTO_MODEL}
+    return {
+        "css": """
     <style>
     .main {
         padding-top: 2rem;
@@ -58,15 +256,28 @@ st.markdown("""
         font-size: 1rem;
     }
     </style>
-""", unsafe_allow_html=True)
+""",
+        "model_options": model_options,
+        "model_labels": list(model_options.keys()),
+    }
+
+st.markdown(get_static_ui()["css"], unsafe_allow_html=True)
 
 # Main app
 def main():
     initialize_session()
     client = get_groq_client()
+    response_cache = get_response_cache()
+    engine = get_chat_engine()
+    loop = get_background_loop()
+    session_id = st.session_state.session_id
+
+    # Create the Groq clients (and import groq/httpx) off the render path
+    if client is not None and not client.connected and client.connect_error is None:
+        loop.call_soon(connect_groq_client, client, get_metrics())
 
     # Check if API is available
-    if client:
+    if client and client.connect_error is None:
         st.session_state.api_available = True
     else:
         st.session_state.api_available = False
@@ -77,7 +288,11 @@ def main():
 
         # Personality selector
         st.subheader("🎭 Select Personality")
-        personality_options = list(PERSONALITIES.keys())
+        registry = get_prompt_registry()
+        personalities = registry.personalities
+        personality_options = registry.names
+        if st.session_state.selected_personality not in personalities:
+            st.session_state.selected_personality = personality_options[0]
         selected_personality = st.radio(
             "Choose a chatbot personality:",
             personality_options,
@@ -86,7 +301,7 @@ def main():
         st.session_state.selected_personality = selected_personality
 
         # Show personality description
-        personality_info = PERSONALITIES[selected_personality]
+        personality_info = personalities[selected_personality]
         st.info(f"**{selected_personality}**\n\n{personality_info['description']}")
 
         st.divider()
@@ -95,6 +310,10 @@ def main():
         st.subheader("🔑 API Status")
         if st.session_state.api_available:
             st.success("✅ Groq API Connected")
+            st.caption(f"{len(client.keys)} API key(s) in rotation")
+        elif client is not None and client.connect_error is not None:
+            st.warning("⚠️ Groq Client Failed to Start - Demo Mode Active")
+            st.caption(f"{type(client.connect_error).__name__}: {client.connect_error}")
         else:
             st.warning("⚠️ API Not Available - Demo Mode Active")
             st.caption("Add GROQ_API_KEY to Streamlit Secrets to enable full features")
@@ -102,23 +321,80 @@ def main():
         # Model selector (only if API available)
         if st.session_state.api_available:
             st.subheader("🧠 AI Model Selection")
-            model_options = {
-                "LLaMA 3.1 8B (Fast)": "llama-3.1-8b-instant",
-                "LLaMA 3.3 70B (Powerful)": "llama-3.3-70b-versatile",
-                "Qwen 3 32B": "qwen/qwen3-32b",
-            }
+            model_options = get_static_ui()["model_options"]
             selected_model_label = st.selectbox(
                 "Select AI Model:",
-                list(model_options.keys()),
+                get_static_ui()["model_labels"],
                 index=0
             )
             st.session_state.selected_model = model_options[selected_model_label]
 
+            cache_stats = response_cache.stats()
+            st.caption(f"Response cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+            if engine.coalescer is not None:
+                coalesce_stats = engine.coalescer.stats()
+                st.caption(f"Coalesced requests: {coalesce_stats['coalesced_requests']} "
+                           f"of {coalesce_stats['upstream_requests'] + coalesce_stats['coalesced_requests']}")
+
+            last_turn = engine.get_last_turn(session_id)
+            if st.session_state.selected_model == AUTO_MODEL and last_turn and last_turn["source"] == "groq":
+                st.caption(f"Auto routed last reply to {last_turn['model']}")
+
+            if last_turn and last_turn["context"]:
+                context = last_turn["context"]
+                st.caption(
+                    f"Last turn sent ~{context['tokens']} / {context['budget']} tokens"
+                    + (f" ({context['dropped']} older messages trimmed)" if context['dropped'] else "")
+                )
+
+            summary = engine.get_summary(session_id) if engine.summarizer is not None else None
+            if summary:
+                st.caption(f"First {summary['through_seq'] + 1} messages sent as a ~{summary['tokens']}-token summary")
+
+            if st.session_state.last_render_stats:
+                render_stats = st.session_state.last_render_stats
+                st.caption(f"Last reply: {render_stats['chunks']} chunks, {render_stats['render_calls']} renders")
+
+            # Pre-flight refusal gate
+            st.session_state.preflight_enabled = st.toggle(
+                "⚡ Pre-flight refusal gate",
+                value=st.session_state.preflight_enabled,
+                help="Answer clearly off-topic questions locally instead of calling Groq"
+            )
+            if st.session_state.preflight_enabled:
+                stats = PREFLIGHT_STATS.snapshot()
+                st.caption(
+                    f"Avoided calls: {stats['avoided_calls']} / {stats['checks']} | "
+                    f"Latency saved: {stats['latency_saved_seconds']:.1f}s"
+                )
+                speculation = stats["speculation"].get(st.session_state.selected_personality)
+                if speculation:
+                    st.caption(
+                        f"Speculative: {speculation['refused']} / {speculation['requests']} cancelled, "
+                        f"~{speculation['wasted_prompt_tokens'] + speculation['wasted_tokens']} tokens and "
+                        f"{speculation['wasted_seconds']:.1f}s wasted, "
+                        f"{speculation['hidden_check_seconds'] * 1000:.0f} ms of checks hidden"
+                    )
+
+            # Multi-personality fan-out
+            st.session_state.fan_out_enabled = st.toggle(
+                "🔀 Ask several personalities",
+                value=st.session_state.fan_out_enabled,
+                help="Stream answers from several personas side by side"
+            )
+            if st.session_state.fan_out_enabled:
+                st.session_state.fan_out_personalities = st.multiselect(
+                    "Personalities (empty = pick by topic):",
+                    personality_options,
+                    default=[name for name in st.session_state.fan_out_personalities if name in personalities]
+                )
+
         st.divider()
 
         # Clear chat history button
         if st.button("🗑️ Clear Chat History", use_container_width=True):
-            st.session_state.messages = []
+            loop.run(engine.clear_session(session_id))
+            st.session_state.older_messages = []
             st.rerun()
 
         st.divider()
@@ -141,16 +417,24 @@ def main():
         st.markdown(f"**Current Personality:** {st.session_state.selected_personality} | **Mode:** Demo (No API)")
         st.info("💡 **Demo Mode:** Add your Groq API key to Streamlit Secrets for full functionality. Go to 'Manage app' → Settings → Secrets")
 
-    # Display chat messages
-    for message in st.session_state.messages:
+    # Display chat messages - recent window, plus older turns loaded on request
+    recent_messages = engine.get_history(session_id)
+    older_messages = st.session_state.older_messages
+    if older_messages and recent_messages and older_messages[-1]["seq"] + 1 < recent_messages[0]["seq"]:
+        # The window moved on since older turns were loaded; fill the gap
+        gap = recent_messages[0]["seq"] - older_messages[-1]["seq"] - 1
+        older_messages.extend(engine.get_older_history(session_id, recent_messages[0]["seq"], gap))
+    oldest_seq = (st.session_state.older_messages or recent_messages or [{"seq": 0}])[0]["seq"]
+    if oldest_seq > 0 and st.button("⬆️ Load older messages"):
+        older = engine.get_older_history(session_id, oldest_seq)
+        st.session_state.older_messages = older + st.session_state.older_messages
+
+    for message in st.session_state.older_messages + recent_messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
     # Chat input
     if prompt := st.chat_input("Type your message..."):
-        # Add user message to session
-        st.session_state.messages.append({"role": "user", "content": prompt})
-
         # Display user message
         with st.chat_message("user"):
             st.markdown(prompt)
@@ -159,48 +443,41 @@ def main():
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
 
-            if st.session_state.api_available and client:
+            if st.session_state.api_available and client and st.session_state.fan_out_enabled:
+                try:
+                    render_fan_out(engine, loop, session_id, prompt, message_placeholder.container())
+                except Exception as e:
+                    st.error(f"❌ Error ({type(e).__name__}): {str(e)}")
+
+            elif st.session_state.api_available and client:
                 try:
                     with st.spinner("🤔 Thinking..."):
-                        system_prompt = get_system_prompt(
+                        reply = engine.stream_reply(
+                            session_id,
+                            prompt,
                             st.session_state.selected_personality,
-                            PERSONALITIES
+                            st.session_state.selected_model,
+                            preflight=st.session_state.preflight_enabled
                         )
 
-                        # Prepare messages for API
-                        api_messages = [
-                            {"role": "system", "content": system_prompt}
-                        ]
-
-                        # Add conversation history
-                        for msg in st.session_state.messages[:-1]:
-                            api_messages.append({
-                                "role": msg["role"],
-                                "content": msg["content"]
-                            })
-
-                        # Stream response from Groq
-                        full_response = ""
-                        stream = client.chat.completions.create(
-                            model=st.session_state.selected_model,
-                            messages=api_messages,
-                            temperature=0.7,
-                            max_tokens=1024,
-                            stream=True,
+                        renderer = StreamRenderer(
+                            message_placeholder.container(),
+                            min_interval=STREAM_FLUSH_INTERVAL,
+                            max_pending_chunks=STREAM_FLUSH_CHUNKS
+                        )
+                        for chunk in loop.iterate(reply):
+                            renderer.write(chunk)
+
+                        renderer.finish()
+                        st.session_state.last_render_stats = renderer.stats()
+                        get_metrics().inc(
+                            "chat_render_flushes_total",
+                            renderer.render_calls,
+                            personality=st.session_state.selected_personality
                         )
-
-                        for chunk in stream:
-                            if chunk.choices[0].delta.content:
-                                full_response += chunk.choices[0].delta.content
-                                message_placeholder.markdown(full_response + "▌")
-
-                        message_placeholder.markdown(full_response)
-
-                    # Add assistant response to session
-                    st.session_state.messages.append({"role": "assistant", "content": full_response})
 
                 except Exception as e:
-                    error_msg = f"❌ Error: {str(e)}"
+                    error_msg = f"❌ Error ({type(e).__name__}): {str(e)}"
                     st.error(error_msg)
                     message_placeholder.markdown(error_msg)
 
@@ -224,7 +501,8 @@ Since the Groq API is not configured, I can't provide real AI responses. However
 Your question: "{prompt}" would then be answered by the {st.session_state.selected_personality}! 🚀"""
 
                 message_placeholder.markdown(demo_response)
-                st.session_state.messages.append({"role": "assistant", "content": demo_response})
+                engine.append_message(session_id, "user", prompt)
+                engine.append_message(session_id, "assistant", demo_response)
 
 if __name__ == "__main__":
     main()
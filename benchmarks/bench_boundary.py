@@ -0,0 +1,135 @@
+"""
+Micro-benchmark for the personality boundary check.
+
+Compares the compiled matcher in src/utils.py against the original
+per-keyword substring scan and verifies both give the same decisions.
+
+Usage:
+    python benchmarks/bench_boundary.py [--rounds 200]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.personalities import PERSONALITIES
+from src.utils import classify_all, enforce_personality_boundary
+
+SAMPLE_MESSAGES = [
+    "2+2",
+    "What is calculus?",
+    "Solve x² + 5x + 6 = 0",
+    "What are symptoms of flu?",
+    "I have a headache",
+    "Is diabetes treatable?",
+    "Where should I visit in Japan?",
+    "Best hotels in Paris",
+    "How to get around London?",
+    "How do I make homemade pasta?",
+    "Chocolate cake recipe",
+    "Cooking tips for beginners",
+    "My computer is slow",
+    "How do I fix WiFi?",
+    "How to install Python?",
+    "Who won the football match yesterday?",
+    "Tell me a joke about cats",
+    "Write me a poem about the ocean and the moon, make it rhyme please!",
+    "Can you recommend a good book on philosophy?",
+    "thanks, that was helpful",
+]
+
+
+def legacy_enforce_personality_boundary(user_input, personality, personalities_dict):
+    """The original per-keyword implementation, kept here as the baseline"""
+    if personality not in personalities_dict:
+        return {"allowed": False, "response": "Unknown personality selected."}
+
+    personality_info = personalities_dict[personality]
+    keywords = personality_info.get("keywords", [])
+    refuse_message = personality_info.get("refuse_message", "I can't answer that question.")
+    cleaned_input = re.sub(r'[?!.,;:\'"()]', '', user_input.lower())
+    words = cleaned_input.split()
+
+    for keyword in keywords:
+        keyword_lower = keyword.lower()
+        if keyword_lower in cleaned_input or any(keyword_lower in word for word in words):
+            return {"allowed": True, "response": ""}
+
+    if personality == "Math Teacher" and re.search(r'[\d\+\-\*/\(\)\^=]+', user_input):
+        return {"allowed": True, "response": ""}
+
+    common_phrases = {
+        "Math Teacher": ["how do i", "solve", "calculate", "what is", "explain", "problem",
+                         "simplify", "factor", "expand", "derivative", "integral", "equals",
+                         "plus", "minus", "times", "divided", "formula", "equation"],
+        "Doctor": ["i have", "symptoms", "feeling", "health", "should i", "do i have",
+                   "pain", "fever", "sick", "disease", "medical", "treatment", "medicine",
+                   "doctor", "illness", "condition", "cure"],
+        "Travel Guide": ["where should", "best place", "how to get", "visit", "trip", "vacation",
+                         "travel", "destination", "hotel", "flight", "tour", "sightseeing",
+                         "country", "city", "airport", "recommend"],
+        "Chef": ["recipe", "how to make", "cooking", "ingredients", "prepare", "cook", "bake",
+                 "dish", "food", "meal", "sauce", "ingredient", "seasoning", "taste", "flavor"],
+        "Tech Support": ["error", "not working", "how to fix", "install", "setup", "problem",
+                         "crash", "bug", "computer", "software", "hardware", "debug", "troubleshoot",
+                         "code", "program", "network", "connection"]
+    }
+    for phrase in common_phrases.get(personality, []):
+        if phrase in cleaned_input:
+            return {"allowed": True, "response": ""}
+
+    return {"allowed": False, "response": refuse_message}
+
+
+def time_per_message(func, rounds):
+    """Run func over every (message, personality) pair and return microseconds per call"""
+    pairs = [(message, personality) for message in SAMPLE_MESSAGES for personality in PERSONALITIES]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message, personality in pairs:
+            func(message, personality, PERSONALITIES)
+    elapsed = time.perf_counter() - start
+    return elapsed / (rounds * len(pairs)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    mismatches = 0
+    for message in SAMPLE_MESSAGES:
+        for personality in list(PERSONALITIES) + ["Unknown"]:
+            expected = legacy_enforce_personality_boundary(message, personality, PERSONALITIES)
+            actual = enforce_personality_boundary(message, personality, PERSONALITIES)
+            if expected != actual:
+                mismatches += 1
+                print(f"MISMATCH: {personality!r} {message!r}: {expected} != {actual}")
+        expected_all = {p: legacy_enforce_personality_boundary(message, p, PERSONALITIES)["allowed"]
+                        for p in PERSONALITIES}
+        if classify_all(message, PERSONALITIES) != expected_all:
+            mismatches += 1
+            print(f"MISMATCH in classify_all: {message!r}")
+
+    legacy_us = time_per_message(legacy_enforce_personality_boundary, args.rounds)
+    compiled_us = time_per_message(enforce_personality_boundary, args.rounds)
+
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        for message in SAMPLE_MESSAGES:
+            classify_all(message, PERSONALITIES)
+    classify_all_us = (time.perf_counter() - start) / (args.rounds * len(SAMPLE_MESSAGES)) * 1e6
+
+    print(f"decision mismatches:           {mismatches}")
+    print(f"legacy   (per message/persona): {legacy_us:8.2f} us")
+    print(f"compiled (per message/persona): {compiled_us:8.2f} us  ({legacy_us / compiled_us:.1f}x)")
+    print(f"classify_all (all personas):    {classify_all_us:8.2f} us")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
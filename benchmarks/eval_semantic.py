@@ -0,0 +1,175 @@
+"""
+Compare the semantic classifier with the keyword heuristic.
+
+Reports per-personality precision and recall of "in domain" decisions on a
+small labelled corpus, plus batched scoring latency. Also checks that the
+pre-flight gate's keyword heuristic never refuses an in-domain prompt; the
+exit status is non-zero if it does.
+
+Usage:
+    python benchmarks/eval_semantic.py [--min-score 0.06] [--margin 1.2]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.personalities import PERSONALITIES
+from src.preflight import REFUSE, preflight_check
+from src.semantic import SemanticClassifier, load_or_build_classifier
+from src.utils import enforce_personality_boundary
+
+# (message, personality whose domain it belongs to, or None if off-topic for all)
+LABELLED_PROMPTS = [
+    ("What is calculus?", "Math Teacher"),
+    ("Solve x² + 5x + 6 = 0", "Math Teacher"),
+    ("How do I find the area of a circle?", "Math Teacher"),
+    ("Can you explain the Pythagorean theorem?", "Math Teacher"),
+    ("What's the integral of sin(x)?", "Math Teacher"),
+    ("How do I simplify fractions?", "Math Teacher"),
+    ("What is the probability of rolling two sixes?", "Math Teacher"),
+    ("Explain standard deviation in statistics", "Math Teacher"),
+    ("How do matrices multiply?", "Math Teacher"),
+    ("What is a prime number?", "Math Teacher"),
+    ("What are symptoms of flu?", "Doctor"),
+    ("I have a headache and a sore throat", "Doctor"),
+    ("Is diabetes treatable?", "Doctor"),
+    ("How much sleep does an adult need to stay healthy?", "Doctor"),
+    ("What causes high blood pressure?", "Doctor"),
+    ("Should I take ibuprofen for a fever?", "Doctor"),
+    ("How do vaccines work?", "Doctor"),
+    ("What are the signs of dehydration?", "Doctor"),
+    ("My knee hurts when I run", "Doctor"),
+    ("How can I lower my cholesterol?", "Doctor"),
+    ("Where should I visit in Japan?", "Travel Guide"),
+    ("Best hotels in Paris", "Travel Guide"),
+    ("How to get around London?", "Travel Guide"),
+    ("Do I need a visa to visit Thailand?", "Travel Guide"),
+    ("Plan a 5 day itinerary for Rome", "Travel Guide"),
+    ("What is the best time of year to go to Bali?", "Travel Guide"),
+    ("Cheap flights from New York to Lisbon", "Travel Guide"),
+    ("What should I pack for a backpacking trip in Peru?", "Travel Guide"),
+    ("Which beaches in Greece are worth seeing?", "Travel Guide"),
+    ("Is Iceland expensive for tourists?", "Travel Guide"),
+    ("How do I make homemade pasta?", "Chef"),
+    ("Chocolate cake recipe", "Chef"),
+    ("Cooking tips for beginners", "Chef"),
+    ("How long should I roast a chicken?", "Chef"),
+    ("What can I substitute for eggs in baking?", "Chef"),
+    ("How do I make a creamy tomato sauce?", "Chef"),
+    ("What spices go well with lamb?", "Chef"),
+    ("How do I caramelize onions?", "Chef"),
+    ("Best way to grill a steak", "Chef"),
+    ("How do I keep rice from getting sticky?", "Chef"),
+    ("My computer is slow", "Tech Support"),
+    ("How do I fix WiFi?", "Tech Support"),
+    ("How to install Python?", "Tech Support"),
+    ("My laptop won't turn on", "Tech Support"),
+    ("Why does my phone keep restarting?", "Tech Support"),
+    ("How do I update my graphics driver?", "Tech Support"),
+    ("Printer says it's offline", "Tech Support"),
+    ("How do I back up my files to an external drive?", "Tech Support"),
+    ("Excel keeps freezing when I open a file", "Tech Support"),
+    ("How do I reset my router?", "Tech Support"),
+    ("Who won the football match yesterday?", None),
+    ("Tell me a joke about cats", None),
+    ("Write me a poem about the ocean", None),
+    ("Can you recommend a good book on philosophy?", None),
+    ("What do you think about the election?", None),
+    ("thanks, that was helpful", None),
+    ("Who painted the Mona Lisa?", None),
+    ("What is the meaning of life?", None),
+    ("Translate hello into French", None),
+    ("What's your favourite movie?", None),
+    ("How tall is Mount Everest?", None),
+    ("Explain the plot of Hamlet", None),
+    ("What is the capital of Australia?", None),
+    ("Give me relationship advice", None),
+    ("How do I become a better public speaker?", None),
+]
+
+# In-domain prompts that mention a number or a generic stem ("what is", "explain") and
+# were once refused by the pre-flight gate because another domain matched loosely
+GATE_REGRESSIONS = [
+    ("How long should I boil 2 eggs?", "Chef"),
+    ("What is insulin?", "Doctor"),
+    ("Can you explain sourdough starter?", "Chef"),
+    ("My iPhone 15 keeps rebooting", "Tech Support"),
+    ("Is Kyoto nice in April 2025?", "Travel Guide"),
+]
+
+
+def false_refusals():
+    """In-domain prompts the keyword pre-flight gate refuses for their own personality"""
+    prompts = [(message, label) for message, label in LABELLED_PROMPTS if label is not None] + GATE_REGRESSIONS
+    return [(message, label) for message, label in prompts
+            if preflight_check(message, label, PERSONALITIES)["decision"] == REFUSE]
+
+
+def precision_recall(predicted, expected):
+    true_positive = sum(p and e for p, e in zip(predicted, expected))
+    predicted_positive = sum(predicted)
+    actual_positive = sum(expected)
+    precision = true_positive / predicted_positive if predicted_positive else 0.0
+    recall = true_positive / actual_positive if actual_positive else 0.0
+    return precision, recall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--min-score", type=float, help="override the classifier's score floor")
+    parser.add_argument("--margin", type=float, help="override the classifier's winning margin")
+    parser.add_argument("--rounds", type=int, default=50, help="timing rounds for batched scoring")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        load_or_build_classifier(PERSONALITIES, directory)
+        classifier = SemanticClassifier.load(directory)
+        if args.min_score is not None:
+            classifier.min_score = args.min_score
+        if args.margin is not None:
+            classifier.margin = args.margin
+
+        messages = [message for message, _ in LABELLED_PROMPTS]
+        predictions = classifier.predict_batch(messages)
+
+        print(f"{'personality':>14} | {'heuristic P/R':>15} | {'semantic P/R':>15}")
+        totals = {"heuristic": [0.0, 0.0], "semantic": [0.0, 0.0]}
+        for personality in PERSONALITIES:
+            expected = [label == personality for _, label in LABELLED_PROMPTS]
+            heuristic = [enforce_personality_boundary(message, personality, PERSONALITIES)["allowed"]
+                         for message in messages]
+            column = classifier.column(personality)
+            semantic = [int(prediction) == column for prediction in predictions]
+            h_precision, h_recall = precision_recall(heuristic, expected)
+            s_precision, s_recall = precision_recall(semantic, expected)
+            totals["heuristic"][0] += h_precision
+            totals["heuristic"][1] += h_recall
+            totals["semantic"][0] += s_precision
+            totals["semantic"][1] += s_recall
+            print(f"{personality:>14} | {h_precision:6.2f} / {h_recall:5.2f} | {s_precision:6.2f} / {s_recall:5.2f}")
+
+        count = len(PERSONALITIES)
+        print(f"{'macro average':>14} | {totals['heuristic'][0] / count:6.2f} / {totals['heuristic'][1] / count:5.2f}"
+              f" | {totals['semantic'][0] / count:6.2f} / {totals['semantic'][1] / count:5.2f}")
+
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            classifier.predict_batch(messages)
+        per_message = (time.perf_counter() - start) / (args.rounds * len(messages))
+        print(f"batched scoring: {per_message * 1e6:.1f} us per message "
+              f"(min score {classifier.min_score}, margin {classifier.margin})")
+
+    refused = false_refusals()
+    for message, label in refused:
+        print(f"FALSE REFUSAL: {label!r} {message!r}")
+    print(f"pre-flight false refusals: {len(refused)}")
+    return 1 if refused else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""
+Load test for the chat path against the local mock Groq server.
+
+Drives ChatEngine with N concurrent simulated users over AsyncGroq and
+reports time-to-first-token, tokens/sec, end-to-end latency percentiles
+and retained memory per session. Results are written as JSON; pass --baseline to
+compare against an earlier run and fail on regressions.
+
+Usage:
+    python benchmarks/load_test.py --users 50 --turns 3 --output bench_results.json
+    python benchmarks/load_test.py --baseline bench_results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.coalesce import create_request_coalescer
+from src.engine import ChatEngine
+from src.models import DEFAULT_MODEL
+
+PROMPTS = [
+    "What is the derivative of x^2?",
+    "How do I solve a quadratic equation?",
+    "Explain the Pythagorean theorem",
+    "What is a prime number?",
+]
+
+# Metrics compared against a baseline; higher is worse for all of them
+REGRESSION_METRICS = ("ttft_p95", "latency_p95", "memory_per_session_kb")
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate retained size of an object graph in bytes"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, deque)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+def start_server_process(args):
+    """Run the mock server in its own process so it does not compete for the GIL"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_groq_server.py")
+    process = subprocess.Popen([
+        sys.executable, server_script, "--port", str(port),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--latency", str(args.latency),
+        "--response-tokens", str(args.response_tokens),
+        "--error-rate", str(args.error_rate),
+        "--rate-limit-rate", str(args.rate_limit_rate),
+    ], stdout=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("mock Groq server did not start")
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+async def simulated_user(engine, user_id, turns, think_time, samples, errors):
+    """One user sending a few prompts in sequence"""
+    session_id = f"load-{user_id}"
+    for turn in range(turns):
+        prompt = PROMPTS[(user_id + turn) % len(PROMPTS)]
+        start = time.perf_counter()
+        first_token = None
+        tokens = 0
+        try:
+            async for _ in engine.stream_reply(session_id, prompt, "Math Teacher", DEFAULT_MODEL):
+                if first_token is None:
+                    first_token = time.perf_counter()
+                tokens += 1
+        except Exception as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            continue
+        end = time.perf_counter()
+        samples.append({
+            "ttft": (first_token or end) - start,
+            "latency": end - start,
+            "tokens": tokens,
+            "tokens_per_second": tokens / (end - first_token) if first_token and end > first_token else 0.0,
+        })
+        if think_time:
+            await asyncio.sleep(think_time)
+
+
+async def run_load(base_url, users, turns, think_time, coalesce_window=0.0):
+    from groq import AsyncGroq
+
+    client = AsyncGroq(api_key="mock", base_url=base_url, max_retries=0)
+    engine = ChatEngine(client, coalescer=create_request_coalescer(coalesce_window))
+    samples, errors = [], {}
+
+    start = time.perf_counter()
+    await asyncio.gather(*(simulated_user(engine, user, turns, think_time, samples, errors)
+                           for user in range(users)))
+    wall_time = time.perf_counter() - start
+    # Per-session reply state plus the history windows the conversation store keeps in memory
+    engine.store.flush()
+    session_memory = deep_sizeof([engine.sessions, getattr(engine.store, "_sessions", {})])
+    if engine.coalescer is not None:
+        upstream_requests = engine.coalescer.stats()["upstream_requests"]
+    else:
+        upstream_requests = len(samples) + sum(errors.values())
+    await client.close()
+    return samples, errors, wall_time, session_memory, upstream_requests
+
+
+def summarize(samples, errors, wall_time, session_memory, upstream_requests, args):
+    ttfts = [sample["ttft"] for sample in samples]
+    latencies = [sample["latency"] for sample in samples]
+    rates = [sample["tokens_per_second"] for sample in samples if sample["tokens_per_second"]]
+    total_tokens = sum(sample["tokens"] for sample in samples)
+    return {
+        "config": {
+            "users": args.users,
+            "turns": args.turns,
+            "tokens_per_second": args.tokens_per_second,
+            "latency": args.latency,
+            "response_tokens": args.response_tokens,
+            "error_rate": args.error_rate,
+            "rate_limit_rate": args.rate_limit_rate,
+            "coalesce_window": args.coalesce_window,
+        },
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "requests": len(samples) + sum(errors.values()),
+        "upstream_requests": upstream_requests,
+        "errors": errors,
+        "wall_time": wall_time,
+        "throughput_tokens_per_second": total_tokens / wall_time if wall_time else 0.0,
+        "ttft_p50": percentile(ttfts, 0.50),
+        "ttft_p95": percentile(ttfts, 0.95),
+        "ttft_p99": percentile(ttfts, 0.99),
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_p99": percentile(latencies, 0.99),
+        "tokens_per_second_p50": percentile(rates, 0.50),
+        "memory_per_session_kb": session_memory / args.users / 1024 if args.users else 0.0,
+    }
+
+
+def compare(results, baseline_path, tolerance):
+    """Print metric changes against a baseline; return the number of regressions"""
+    with open(baseline_path, encoding="utf-8") as handle:
+        baseline = json.load(handle)
+    regressions = 0
+    for metric in REGRESSION_METRICS:
+        old, new = baseline.get(metric), results.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        flag = "REGRESSION" if change > tolerance else "ok"
+        regressions += flag != "ok"
+        print(f"{metric:>24}: {old:.4f} -> {new:.4f} ({change:+.1%}) {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the chat engine against a mock Groq server")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds between a user's turns")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--response-tokens", type=int, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--coalesce-window", type=float, default=0.0,
+                        help="share identical in-flight requests started within this many seconds")
+    parser.add_argument("--base-url", help="use an already running server instead of starting one")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server, base_url = start_server_process(args)
+
+    try:
+        samples, errors, wall_time, session_memory, upstream_requests = asyncio.run(
+            run_load(base_url, args.users, args.turns, args.think_time, args.coalesce_window))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    results = summarize(samples, errors, wall_time, session_memory, upstream_requests, args)
+    print(json.dumps(results, indent=2))
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(results, handle, indent=2)
+
+    if args.baseline:
+        return 1 if compare(results, args.baseline, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+Local stand-in for the Groq chat-completions streaming endpoint.
+
+Serves POST /openai/v1/chat/completions with OpenAI-style server-sent
+events, so AsyncGroq / Groq clients can point at it with base_url.
+Token rate, initial latency and error injection are configurable.
+
+Usage:
+    python benchmarks/mock_groq_server.py --port 8787 --tokens-per-second 200
+    GROQ_BASE_URL=http://127.0.0.1:8787 GROQ_API_KEY=mock streamlit run app.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHAT_COMPLETIONS_PATH = "/openai/v1/chat/completions"
+
+FILLER_WORDS = ("the", "answer", "depends", "on", "a", "few", "simple", "steps", "first", "we",
+                "look", "at", "what", "you", "asked", "and", "then", "explain", "it", "clearly")
+
+
+class MockGroqHTTPServer(ThreadingHTTPServer):
+    """Threaded server with a listen backlog large enough for load tests"""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class MockGroqConfig:
+    """Behaviour of the mock server; attributes can be changed while it runs"""
+
+    def __init__(self, tokens_per_second: float = 200.0, latency: float = 0.1, response_tokens: int = 100,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, seed: int = None):
+        self.tokens_per_second = tokens_per_second
+        self.latency = latency
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def count_request(self) -> int:
+        with self._lock:
+            self.requests += 1
+            return self.requests
+
+
+def _chunk(completion_id: str, model: str, content=None, finish_reason=None, usage=None) -> bytes:
+    delta = {} if content is None else {"role": "assistant", "content": content}
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage is not None:
+        payload["x_groq"] = {"id": completion_id, "usage": usage}
+    return f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+
+def make_handler(config: MockGroqConfig):
+    """Build a request handler class bound to a config"""
+
+    class MockGroqHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_error(self, status: int, message: str, error_type: str) -> None:
+            body = json.dumps({"error": {"message": message, "type": error_type}}).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.rstrip("/") != CHAT_COMPLETIONS_PATH:
+                self._send_error(404, f"Unknown path {self.path}", "not_found")
+                return
+
+            config.count_request()
+            roll = config.random.random()
+            if roll < config.rate_limit_rate:
+                self._send_error(429, "Rate limit reached (mock)", "rate_limit_exceeded")
+                return
+            if roll < config.rate_limit_rate + config.error_rate:
+                self._send_error(500, "Internal server error (mock)", "internal_server_error")
+                return
+
+            time.sleep(config.latency)
+            model = request.get("model", "mock-model")
+            max_tokens = request.get("max_tokens") or config.response_tokens
+            token_count = min(config.response_tokens, max_tokens)
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            interval = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+
+            if not request.get("stream"):
+                text = " ".join(FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(token_count))
+                time.sleep(interval * token_count)
+                body = json.dumps({
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": token_count, "total_tokens": token_count},
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            try:
+                for index in range(token_count):
+                    word = FILLER_WORDS[index % len(FILLER_WORDS)]
+                    self.wfile.write(_chunk(completion_id, model, word if index == 0 else " " + word))
+                    self.wfile.flush()
+                    if interval:
+                        time.sleep(interval)
+                usage = {"prompt_tokens": 0, "completion_tokens": token_count, "total_tokens": token_count}
+                self.wfile.write(_chunk(completion_id, model, finish_reason="stop", usage=usage))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # Client cancelled the stream
+                pass
+
+    return MockGroqHandler
+
+
+def start_mock_server(config: MockGroqConfig = None, host: str = "127.0.0.1", port: int = 0):
+    """
+    Start the mock server in a daemon thread.
+
+    Args:
+        config: Server behaviour, defaults to MockGroqConfig()
+        host: Interface to bind
+        port: Port to bind, 0 picks a free port
+
+    Returns:
+        (server, base_url) tuple; call server.shutdown() to stop it
+    """
+    config = config or MockGroqConfig()
+    server = MockGroqHTTPServer((host, port), make_handler(config))
+    server.config = config
+    threading.Thread(target=server.serve_forever, name="mock-groq", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the Groq streaming chat endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds before the first token")
+    parser.add_argument("--response-tokens", type=int, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with 429")
+    args = parser.parse_args()
+
+    config = MockGroqConfig(args.tokens_per_second, args.latency, args.response_tokens,
+                            args.error_rate, args.rate_limit_rate)
+    server = MockGroqHTTPServer((args.host, args.port), make_handler(config))
+    print(f"Mock Groq server on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Cold-start benchmark for the Streamlit app.
+
+Runs the app once in a fresh interpreter under ``python -X importtime`` via
+Streamlit's AppTest, then reports the slowest imports, the import cost of
+the project's own modules and heavy dependencies, and the first-render and
+rerun latency. Each run uses a new process so nothing is warm.
+
+Usage:
+    python benchmarks/startup.py [--runs 3] [--top 15] [--output startup.json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules whose import cost we track explicitly
+TRACKED_PREFIXES = ("src", "groq", "httpx", "dotenv", "numpy", "yaml", "http.server")
+
+CHILD_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+harness = time.perf_counter()
+at = AppTest.from_file("app.py", default_timeout=60).run()
+first = time.perf_counter()
+at.run()
+rerun = time.perf_counter()
+print(json.dumps({
+    "harness_import_seconds": harness - start,
+    "first_render_seconds": first - harness,
+    "rerun_seconds": rerun - first,
+    "exceptions": len(at.exception),
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """Parse ``-X importtime`` output into {module: (self_us, cumulative_us)}"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def run_once(env):
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD_SCRIPT],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    timings = json.loads(process.stdout.strip().splitlines()[-1])
+    return timings, parse_importtime(process.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to list")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    runs = [run_once(env) for _ in range(args.runs)]
+
+    # Median run by first-render latency
+    runs.sort(key=lambda run: run[0]["first_render_seconds"])
+    timings, modules = runs[len(runs) // 2]
+
+    if timings["exceptions"]:
+        print(f"WARNING: the app raised {timings['exceptions']} exception(s); timings are not meaningful")
+    print(f"first render: {timings['first_render_seconds'] * 1000:.0f} ms, "
+          f"rerun: {timings['rerun_seconds'] * 1000:.0f} ms "
+          f"(median of {args.runs}, AppTest harness import excluded)")
+
+    print(f"\nslowest imports by self time (top {args.top}):")
+    for name, (self_us, cumulative_us) in sorted(modules.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms self  {cumulative_us / 1000:8.1f} ms cumulative  {name}")
+
+    tracked = {name: cumulative_us for name, (_, cumulative_us) in modules.items()
+               if name.split(".")[0] in TRACKED_PREFIXES or name in TRACKED_PREFIXES}
+    top_level = {name: cumulative_us for name, cumulative_us in tracked.items()
+                 if "." not in name or name in TRACKED_PREFIXES or name.startswith("src.")}
+    print("\nproject modules and heavy dependencies (cumulative):")
+    for name, cumulative_us in sorted(top_level.items(), key=lambda item: -item[1]):
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+    lazy = [name for name in ("groq", "httpx", "numpy", "yaml", "http.server") if name not in modules]
+    # The app warms the Groq client up on the engine loop thread, so groq/httpx may still show up here
+    print(f"\nnever imported during the run: {', '.join(lazy) or 'none'}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump({**timings, "tracked_imports_us": top_level, "not_imported": lazy}, handle, indent=2)
+    return 1 if timings["exceptions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,31 @@
 """
 AI Personality Chatbot - Source package
+
+Public names are imported lazily on first access, so ``import src`` (and
+importing any one submodule) does not pull in the rest of the package.
 """
 
-from src.personalities import PERSONALITIES, get_system_prompt
-from src.utils import enforce_personality_boundary
+import importlib
+
+_LAZY_EXPORTS = {
+    "PERSONALITIES": "src.personalities",
+    "PromptRegistry": "src.personalities",
+    "get_system_prompt": "src.personalities",
+    "enforce_personality_boundary": "src.utils",
+    "classify_all": "src.utils",
+}
+
+__all__ = list(_LAZY_EXPORTS)
+
+
+def __getattr__(name):
+    module = _LAZY_EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module 'src' has no attribute '{name}'")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
 
-__all__ = ["PERSONALITIES", "get_system_prompt", "enforce_personality_boundary"]
+def __dir__():
+    return sorted(list(globals()) + __all__)
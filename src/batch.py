@@ -0,0 +1,167 @@
+"""
+Batch boundary classification for offline log replays
+
+Usage:
+    python -m src.batch traffic.jsonl [--field content] [--workers 4]
+"""
+
+import argparse
+import csv
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from src.utils import MATH_EXPRESSION_PATTERN, clean_input, get_boundary_index
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; fall back to plain lists
+    np = None
+
+
+def classify_batch(messages: List[str], personalities: List[str], personalities_dict: Dict[str, Any]):
+    """
+    Check many messages against several personalities at once.
+
+    Each message is cleaned once and then matched against every requested
+    personality. Results are identical to calling enforce_personality_boundary
+    for each (message, personality) pair; unknown personalities are never allowed.
+
+    Args:
+        messages: User messages to classify
+        personalities: Personality names, one result column per name
+        personalities_dict: Dictionary of all personalities
+
+    Returns:
+        Boolean matrix of shape (len(messages), len(personalities)); a NumPy
+        array when NumPy is installed, otherwise a list of lists
+    """
+    index = get_boundary_index(personalities_dict)
+    entries = [index.get(personality) for personality in personalities]
+    patterns = [entry["pattern"] if entry else None for entry in entries]
+    math_columns = [bool(entry and entry["math"]) for entry in entries]
+    check_math = any(math_columns)
+
+    rows = []
+    for message in messages:
+        cleaned = clean_input(message)
+        is_math = check_math and bool(MATH_EXPRESSION_PATTERN.search(message))
+        rows.append([
+            (pattern is not None and pattern.search(cleaned) is not None) or (math and is_math)
+            for pattern, math in zip(patterns, math_columns)
+        ])
+
+    if np is None:
+        return rows
+    if not rows:
+        return np.zeros((0, len(personalities)), dtype=bool)
+    return np.array(rows, dtype=bool)
+
+
+def iter_message_chunks(path: str, field: str = "content", chunk_size: int = 10000) -> Iterator[List[str]]:
+    """
+    Stream messages from a JSONL or CSV file in fixed-size chunks.
+
+    Args:
+        path: Path to a .jsonl or .csv file
+        field: Name of the JSON key / CSV column holding the message text
+        chunk_size: Number of messages per chunk
+
+    Returns:
+        Iterator of message lists
+    """
+    chunk = []
+    with open(path, newline="", encoding="utf-8") as handle:
+        if path.endswith(".csv"):
+            records = (row.get(field) or "" for row in csv.DictReader(handle))
+        else:
+            records = (json.loads(line).get(field) or "" for line in handle if line.strip())
+        for text in records:
+            chunk.append(text)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+# Personalities dict of a pool worker, set once by _init_worker so every chunk reuses its compiled index
+_WORKER_PERSONALITIES: Optional[Dict[str, Any]] = None
+
+
+def _init_worker(personalities_dict: Dict[str, Any]) -> None:
+    """Process pool initializer; receives the personalities dict once per worker"""
+    global _WORKER_PERSONALITIES
+    _WORKER_PERSONALITIES = personalities_dict
+
+
+def _classify_chunk(args):
+    """Process pool entry point; classifies one chunk against the worker's personalities"""
+    messages, personalities = args
+    return classify_batch(messages, personalities, _WORKER_PERSONALITIES)
+
+
+def classify_chunks(chunks: Iterable[List[str]], personalities: List[str], personalities_dict: Dict[str, Any],
+                    workers: int = 1) -> Iterator[Any]:
+    """
+    Classify a stream of message chunks, optionally across a process pool.
+
+    Args:
+        chunks: Iterable of message lists, e.g. from iter_message_chunks
+        personalities: Personality names, one result column per name
+        personalities_dict: Dictionary of all personalities
+        workers: Number of worker processes; 1 runs in-process
+
+    Returns:
+        Iterator of per-chunk result matrices, in input order
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield classify_batch(chunk, personalities, personalities_dict)
+        return
+
+    jobs = ((chunk, personalities) for chunk in chunks)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(personalities_dict,)) as executor:
+        # Keep only a few chunks per worker in flight so memory stays bounded
+        pending = []
+        for job in jobs:
+            pending.append(executor.submit(_classify_chunk, job))
+            if len(pending) >= workers * 2:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from src.personalities import PERSONALITIES
+
+    parser = argparse.ArgumentParser(description="Replay a chat log through the boundary check")
+    parser.add_argument("path", help="JSONL or CSV file of user messages")
+    parser.add_argument("--field", default="content", help="message field / column name")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--personality", action="append", dest="personalities",
+                        help="personality to check (repeatable, default: all)")
+    args = parser.parse_args(argv)
+
+    personalities = args.personalities or list(PERSONALITIES)
+    totals = [0] * len(personalities)
+    count = 0
+    chunks = iter_message_chunks(args.path, args.field, args.chunk_size)
+    for result in classify_chunks(chunks, personalities, PERSONALITIES, args.workers):
+        for row in result:
+            count += 1
+            for column, allowed in enumerate(row):
+                totals[column] += int(allowed)
+
+    print(f"messages: {count}")
+    for personality, allowed in zip(personalities, totals):
+        share = allowed / count if count else 0.0
+        print(f"{personality:>14}: {allowed} allowed ({share:.1%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""
+Response cache for repeated (personality, model, prompt) requests
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    return " ".join(prompt.lower().split()).rstrip("?!. ")
+
+
+def history_hash(messages: List[Dict[str, Any]]) -> str:
+    """Hash the role and content of a list of messages"""
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(message["role"].encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(message["content"].encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def make_cache_key(prompt_hash: str, model: str, prompt: str, history: List[Dict[str, Any]]) -> str:
+    """
+    Build the cache key for a request.
+
+    Args:
+        prompt_hash: Hash of the personality's system prompt, so edited prompts miss
+        model: Groq model id
+        prompt: The new user message
+        history: Messages sent before the new prompt
+
+    Returns:
+        Hex digest identifying the request
+    """
+    parts = [prompt_hash, model, normalize_prompt(prompt), history_hash(history)]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def iter_replay_chunks(text: str, chunk_words: int = 3) -> Iterator[str]:
+    """Split a cached response into small chunks so it can be replayed like a stream"""
+    words = text.split(" ")
+    for start in range(0, len(words), chunk_words):
+        chunk = " ".join(words[start:start + chunk_words])
+        yield chunk if start + chunk_words >= len(words) else chunk + " "
+
+
+class MemoryCacheBackend:
+    """In-process LRU cache with a TTL"""
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, created = entry
+            if time.time() - created > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """On-disk LRU cache with a TTL that survives restarts"""
+
+    # Disk I/O: the engine calls it from a worker thread
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: float = 86400.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Several replicas may share the file; wait for their write locks instead of failing
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS response_cache_accessed ON response_cache (accessed)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE response_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._conn.execute(
+                "DELETE FROM response_cache WHERE key IN ("
+                "SELECT key FROM response_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+class ResponseCache:
+    """Response cache with hit/miss counters over a pluggable backend"""
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self.backend.set(key, value)
+
+    @property
+    def blocking(self) -> bool:
+        """Whether the backend does I/O, so callers on an event loop should use a worker thread"""
+        return getattr(self.backend, "blocking", False)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current number of entries"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.backend),
+        }
+
+
+def create_response_cache(path: Optional[str] = None, max_entries: int = 1000, ttl: float = 3600.0) -> ResponseCache:
+    """
+    Create a response cache, on disk when a path is given and in memory otherwise.
+
+    Args:
+        path: SQLite file for a persistent cache, or None for in-process only
+        max_entries: Maximum number of cached responses (LRU eviction)
+        ttl: Seconds before an entry expires
+
+    Returns:
+        ResponseCache instance
+    """
+    if path:
+        return ResponseCache(SQLiteCacheBackend(path, max_entries=max_entries, ttl=ttl))
+    return ResponseCache(MemoryCacheBackend(max_entries=max_entries, ttl=ttl))
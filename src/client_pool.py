@@ -0,0 +1,344 @@
+"""
+Groq client pool: shared connection pooling, retry with backoff and multi-key rotation
+"""
+
+import asyncio
+import hashlib
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from src.context import estimate_tokens
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError"}
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``rate`` tokens per second"""
+
+    def __init__(self, capacity: float, rate: float, clock=time.monotonic):
+        self.capacity = capacity
+        self.rate = rate
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float = 1.0) -> float:
+        """Seconds until ``amount`` tokens are available (0 if available now)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self._tokens >= amount:
+            return 0.0
+        return (amount - self._tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, amount: float = 1.0) -> None:
+        """Remove tokens; the balance may go negative for oversized requests"""
+        self._refill()
+        self._tokens -= min(amount, self.capacity)
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+
+class KeyRateLimiter:
+    """
+    Request and token buckets of one API key, checked and taken together.
+
+    try_acquire() is the only call the pool makes per key and attempt, so
+    shared limiters (see src/shared_state.py) can do it in one atomic
+    round trip; ``blocking`` tells the pool to run it in a worker thread.
+    """
+
+    blocking = False
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, clock=time.monotonic):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0, clock)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0, clock)
+
+    def try_acquire(self, cost: int) -> float:
+        """Take one request and ``cost`` tokens if both are available; else return seconds to wait"""
+        wait = max(self.requests.wait_time(1), self.tokens.wait_time(cost))
+        if wait == 0.0:
+            self.requests.take(1)
+            self.tokens.take(cost)
+        return wait
+
+    @property
+    def requests_available(self) -> float:
+        return self.requests.available
+
+    @property
+    def tokens_available(self) -> float:
+        return self.tokens.available
+
+
+def is_retryable(error: Exception) -> bool:
+    """Check whether a Groq client error is worth retrying (429, 5xx, network)"""
+    if type(error).__name__ in RETRYABLE_ERRORS:
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read the Retry-After header of an HTTP error, if present"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+class PooledKey:
+    """One API key with its client, rate-limit buckets and load counters"""
+
+    def __init__(self, name: str, client, requests_per_minute: float, tokens_per_minute: float,
+                 limiter_factory: Optional[Callable[[str, float, float], Any]] = None, bucket_id: str = ""):
+        self.name = name
+        self.client = client
+        if limiter_factory is None:
+            limiter_factory = lambda _, rpm, tpm: KeyRateLimiter(rpm, tpm)
+        self.limiter = limiter_factory(bucket_id or name, requests_per_minute, tokens_per_minute)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.calls = 0
+        self.retries = 0
+
+    def cooldown(self) -> float:
+        """Seconds left of a 429 cooldown"""
+        return max(0.0, self.blocked_until - time.monotonic())
+
+    async def try_acquire(self, cost: int) -> float:
+        """Take budget for a request of ``cost`` tokens; 0 on success, else seconds to wait"""
+        if self.limiter.blocking:
+            return await asyncio.to_thread(self.limiter.try_acquire, cost)
+        return self.limiter.try_acquire(cost)
+
+
+class _TrackedStream:
+    """Wraps a response stream to release the key's in-flight slot when it ends"""
+
+    def __init__(self, stream, key: PooledKey):
+        self._stream = stream
+        self._key = key
+        self._released = False
+
+    def _release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._key.in_flight -= 1
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        finally:
+            self._release()
+
+    async def close(self) -> None:
+        try:
+            await self._stream.close()
+        finally:
+            self._release()
+
+
+class _Completions:
+    def __init__(self, pool):
+        self._pool = pool
+
+    async def create(self, **kwargs):
+        return await self._pool.create(**kwargs)
+
+
+class _Chat:
+    def __init__(self, pool):
+        self.completions = _Completions(pool)
+
+
+class GroqClientPool:
+    """
+    Drop-in async Groq client spreading requests over several API keys.
+
+    Every key gets its own client, all sharing one HTTP connection pool.
+    Requests go to the least-loaded (or next round-robin) key that has
+    request and token budget left; when no key has budget the request
+    waits instead of failing. 429/5xx/network errors are retried with
+    exponential backoff and jitter, honouring Retry-After.
+
+    The per-key clients (and the groq/httpx imports behind them) are
+    created by connect(), which runs on the first request unless it was
+    called earlier, e.g. to warm up in the background.
+
+    ``limiter_factory(name, requests_per_minute, tokens_per_minute)``
+    replaces the in-process KeyRateLimiter, e.g. with limits shared by
+    several app replicas (see src/shared_state.py). Limiter names are
+    derived from a hash of the API key, so every replica using a key draws
+    from the same budget.
+    """
+
+    def __init__(self, api_keys: List[str], requests_per_minute: float = 30, tokens_per_minute: float = 6000,
+                 strategy: str = "least_loaded", max_retries: int = 4, base_delay: float = 0.5,
+                 max_delay: float = 8.0, max_queue_wait: float = 60.0,
+                 client_factory: Optional[Callable[[str, Any], Any]] = None, http_client=None,
+                 base_url: Optional[str] = None,
+                 limiter_factory: Optional[Callable[[str, float, float], Any]] = None):
+        if not api_keys:
+            raise ValueError("GroqClientPool needs at least one API key")
+        if strategy not in ("least_loaded", "round_robin"):
+            raise ValueError(f"Unknown strategy: {strategy}")
+
+        self.http_client = http_client
+        self.keys = [
+            PooledKey(f"key-{index}", None, requests_per_minute, tokens_per_minute, limiter_factory,
+                      hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16])
+            for index, api_key in enumerate(api_keys)
+        ]
+        self.connected = False
+        self.connect_error: Optional[Exception] = None
+        self._api_keys = list(api_keys)
+        self._client_factory = client_factory
+        self._base_url = base_url
+        self.strategy = strategy
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_queue_wait = max_queue_wait
+        self.queued = 0
+        self.chat = _Chat(self)
+        self._next_index = 0
+        self._lock = None
+
+    def connect(self) -> None:
+        """Create the per-key clients; safe to call more than once. A failure is kept in ``connect_error``"""
+        if self.connected:
+            return
+        try:
+            client_factory, http_client = self._client_factory, self.http_client
+            if client_factory is None:
+                client_factory, http_client = _groq_client_factory(http_client, self._base_url)
+            self.http_client = http_client
+            for key, api_key in zip(self.keys, self._api_keys):
+                key.client = client_factory(api_key, http_client)
+        except Exception as e:
+            self.connect_error = e
+            raise
+        self.connect_error = None
+        self.connected = True
+
+    def _candidates(self) -> List[PooledKey]:
+        """Keys in the order the strategy prefers them"""
+        if self.strategy == "round_robin":
+            return self.keys[self._next_index:] + self.keys[:self._next_index]
+        # Balances of shared limiters are the last ones seen, which is enough for ordering
+        return sorted(self.keys, key=lambda key: (key.in_flight, -key.limiter.requests_available))
+
+    async def _pick_key(self, cost: int):
+        """Take budget from the first candidate key that has it: (key, 0), or (None, seconds to wait)"""
+        wait = float("inf")
+        for key in self._candidates():
+            key_wait = key.cooldown() or await key.try_acquire(cost)
+            if key_wait == 0.0:
+                self._next_index = (self.keys.index(key) + 1) % len(self.keys)
+                return key, 0.0
+            wait = min(wait, key_wait)
+        return None, wait
+
+    async def _acquire(self, cost: int) -> PooledKey:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        deadline = time.monotonic() + self.max_queue_wait
+        # One waiter at a time keeps queued requests in arrival order
+        async with self._lock:
+            while True:
+                key, wait = await self._pick_key(cost)
+                if key is not None:
+                    key.in_flight += 1
+                    key.calls += 1
+                    return key
+                if time.monotonic() + wait > deadline:
+                    raise TimeoutError(f"No Groq API key had rate-limit budget within {self.max_queue_wait}s")
+                self.queued += 1
+                await asyncio.sleep(wait)
+
+    async def create(self, **kwargs):
+        """Same arguments as ``chat.completions.create`` on AsyncGroq"""
+        self.connect()
+        # Prompt tokens are known up front; completion tokens are not reserved
+        cost = sum(estimate_tokens(message.get("content") or "") for message in kwargs.get("messages", []))
+
+        attempt = 0
+        while True:
+            key = await self._acquire(cost)
+            try:
+                response = await key.client.chat.completions.create(**kwargs)
+            except asyncio.CancelledError:
+                key.in_flight -= 1
+                raise
+            except Exception as e:
+                key.in_flight -= 1
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                retry_after = retry_after_seconds(e)
+                if getattr(e, "status_code", None) == 429:
+                    key.blocked_until = time.monotonic() + (retry_after or backoff_delay(attempt, 1.0, self.max_delay))
+                key.retries += 1
+                await asyncio.sleep(retry_after if retry_after is not None
+                                    else backoff_delay(attempt, self.base_delay, self.max_delay))
+                attempt += 1
+                continue
+
+            if kwargs.get("stream"):
+                return _TrackedStream(response, key)
+            key.in_flight -= 1
+            return response
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-key load and rate-limit state"""
+        now = time.monotonic()
+        return [
+            {
+                "key": key.name,
+                "calls": key.calls,
+                "retries": key.retries,
+                "in_flight": key.in_flight,
+                "requests_available": round(key.limiter.requests_available, 2),
+                "tokens_available": round(key.limiter.tokens_available),
+                "cooldown": max(0.0, key.blocked_until - now),
+            }
+            for key in self.keys
+        ]
+
+    async def close(self) -> None:
+        if self.http_client is not None:
+            await self.http_client.aclose()
+
+
+def _groq_client_factory(http_client=None, base_url: Optional[str] = None):
+    """Build AsyncGroq clients sharing one httpx connection pool (base_url defaults to GROQ_BASE_URL)"""
+    import httpx
+    from groq import AsyncGroq
+
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        )
+
+    def factory(api_key, shared_http_client):
+        # Retries are handled by the pool so they can move to another key
+        return AsyncGroq(api_key=api_key, base_url=base_url, http_client=shared_http_client, max_retries=0)
+
+    return factory, http_client
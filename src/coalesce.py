@@ -0,0 +1,129 @@
+"""
+Single-flight coalescing of identical in-flight chat requests
+"""
+
+import asyncio
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+
+class Flight:
+    """
+    One upstream stream shared by every request with the same key.
+
+    The stream runs in its own task and records each chunk, so subscribers
+    that join late first get the chunks already emitted and then the live
+    tail. The task is cancelled once every subscriber has left.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.started = time.monotonic()
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.abandoned = False
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        # Waiters hold the old event, which stays set; later waiters get a fresh one
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _run(self, stream_factory: Callable[[], AsyncIterator[str]], on_done: Callable[["Flight"], None]):
+        try:
+            async for chunk in stream_factory():
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            on_done(self)
+            self._notify()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """Yield every chunk of the stream from the start, raising its error if it failed"""
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(self.chunks):
+                    yield self.chunks[index]
+                    index += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done and self.task is not None:
+                self.abandoned = True
+                self.task.cancel()
+
+
+class RequestCoalescer:
+    """
+    Share one upstream stream among identical concurrent requests.
+
+    The first request for a key starts the stream; requests with the same
+    key arriving within ``window`` seconds of that start subscribe to it
+    instead of opening their own. Keys should cover everything that shapes
+    the reply (system prompt, model, prompt and history), so sessions whose
+    history differs never share a stream. Must be used from one event loop.
+    """
+
+    def __init__(self, window: float = 2.0):
+        self.window = window
+        self._flights: Dict[str, Flight] = {}
+        self.upstream_requests = 0
+        self.coalesced_requests = 0
+
+    def join(self, key: str, stream_factory: Callable[[], AsyncIterator[str]]) -> Tuple[Flight, bool]:
+        """
+        Get the in-flight stream for a key, starting one if needed.
+
+        Args:
+            key: Identifies requests that would get the same reply
+            stream_factory: Called with no arguments to open the upstream stream
+
+        Returns:
+            (flight, leader) where leader is True if this call started the stream
+        """
+        flight = self._flights.get(key)
+        joinable = (flight is not None and not flight.done and not flight.abandoned
+                    and time.monotonic() - flight.started <= self.window)
+        if joinable:
+            self.coalesced_requests += 1
+            return flight, False
+
+        flight = Flight(key)
+        self._flights[key] = flight
+        self.upstream_requests += 1
+        flight.task = asyncio.ensure_future(flight._run(stream_factory, self._finish))
+        return flight, True
+
+    def _finish(self, flight: Flight) -> None:
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.upstream_requests + self.coalesced_requests
+        return {
+            "in_flight": len(self._flights),
+            "upstream_requests": self.upstream_requests,
+            "coalesced_requests": self.coalesced_requests,
+            "coalesced_rate": self.coalesced_requests / total if total else 0.0,
+        }
+
+
+def create_request_coalescer(window: Optional[float]) -> Optional[RequestCoalescer]:
+    """Build a coalescer, or None when the window is zero or unset"""
+    if not window or window <= 0:
+        return None
+    return RequestCoalescer(window)
@@ -0,0 +1,105 @@
+"""
+Token-budgeted context window for the chat request path
+"""
+
+from typing import Any, Dict, List, Optional
+
+from src.models import DEFAULT_CONTEXT_BUDGET, MODEL_CONTEXT_BUDGETS
+
+# Rough per-message overhead for role and formatting tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the token count of a string without a tokenizer.
+
+    Uses the common ~4 characters per token rule for English text, which is
+    close enough for budgeting and costs nothing to compute.
+
+    Args:
+        text: Message content
+
+    Returns:
+        Estimated number of tokens including per-message overhead
+    """
+    return (len(text) + 3) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+
+def make_message(role: str, content: str) -> Dict[str, Any]:
+    """
+    Create a chat message with its token estimate computed once up front.
+
+    Args:
+        role: 'user' or 'assistant'
+        content: Message content
+
+    Returns:
+        Message dictionary with 'role', 'content' and 'tokens' keys
+    """
+    return {
+        "role": role,
+        "content": content,
+        "tokens": estimate_tokens(content)
+    }
+
+
+def summary_message(summary: Dict[str, Any]) -> Dict[str, str]:
+    """The API message carrying a session's rolling summary, sent right after the system prompt"""
+    return {"role": "system", "content": f"Summary of the earlier conversation:\n{summary['content']}"}
+
+
+def get_context_budget(model: str) -> int:
+    """Get the prompt token budget for a model"""
+    return MODEL_CONTEXT_BUDGETS.get(model, DEFAULT_CONTEXT_BUDGET)
+
+
+def build_context(system_prompt: str, messages: List[Dict[str, Any]], model: str,
+                  system_tokens: Optional[int] = None,
+                  summary: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Build the API message list, dropping the oldest turns that do not fit.
+
+    The system prompt, the summary (if any) and the latest message are
+    always sent. Older messages are added newest-first until the model's
+    token budget is used up.
+
+    Args:
+        system_prompt: The personality's system prompt
+        messages: Conversation history, oldest first, ending with the new user message
+        model: Groq model id used to look up the budget
+        system_tokens: Precomputed token count of the system prompt, if known
+        summary: Summary of turns older than ``messages`` ('content' and
+            'tokens'), sent as a second system message
+
+    Returns:
+        Dictionary with 'messages' (API payload), 'tokens' (estimated tokens
+        sent), 'budget' and 'dropped' (number of history messages left out)
+    """
+    if not messages:
+        raise ValueError("build_context needs at least the latest message")
+    budget = get_context_budget(model)
+    used = system_tokens if system_tokens is not None else estimate_tokens(system_prompt)
+    pinned = [{"role": "system", "content": system_prompt}]
+    if summary is not None:
+        pinned.append(summary_message(summary))
+        used += summary["tokens"]
+
+    kept = []
+    for index in range(len(messages) - 1, -1, -1):
+        message = messages[index]
+        tokens = message.get("tokens")
+        if tokens is None:
+            tokens = estimate_tokens(message["content"])
+        if kept and used + tokens > budget:
+            break
+        kept.append({"role": message["role"], "content": message["content"]})
+        used += tokens
+    kept.reverse()
+
+    return {
+        "messages": pinned + kept,
+        "tokens": used,
+        "budget": budget,
+        "dropped": len(messages) - len(kept)
+    }
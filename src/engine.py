@@ -0,0 +1,581 @@
+"""
+Framework-independent async chat engine
+
+The engine owns prompt assembly, the response cache, the pre-flight gate,
+request coalescing, Groq streaming, per-session history and its rolling
+summaries. It works with AsyncGroq or any
+client exposing the same ``chat.completions.create(..., stream=True)``
+coroutine, and serves many sessions concurrently on one event loop.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.cache import ResponseCache, iter_replay_chunks, make_cache_key
+from src.coalesce import RequestCoalescer
+from src.context import build_context, summary_message
+from src.fanout import CHUNK, merge_streams
+from src.metrics import METRICS, MetricsRegistry, RequestProfiler
+from src.models import MAX_COMPLETION_TOKENS
+from src.personalities import PromptRegistry
+from src.preflight import PREFLIGHT_STATS, REFUSE, PreflightStats, is_speculative, run_preflight
+from src.router import AUTO_MODEL, MODEL_ROUTER, ModelRouter
+from src.store import ConversationStore
+from src.summary import ConversationSummarizer
+
+
+def fan_out_session_id(session_id: str, personality: str) -> str:
+    """Id of the conversation thread one personality keeps within a fan-out session"""
+    return f"{session_id}/fan-out/{personality}"
+
+
+class ChatEngine:
+    """Chat engine serving concurrent streaming sessions"""
+
+    def __init__(self, client, personalities_dict: Optional[Dict[str, Any]] = None,
+                 registry: Optional[PromptRegistry] = None,
+                 response_cache: Optional[ResponseCache] = None,
+                 preflight_stats: PreflightStats = PREFLIGHT_STATS,
+                 router: ModelRouter = MODEL_ROUTER,
+                 store: Optional[ConversationStore] = None,
+                 classifier=None,
+                 coalescer: Optional[RequestCoalescer] = None,
+                 metrics: MetricsRegistry = METRICS,
+                 profiler: Optional[RequestProfiler] = None,
+                 summarizer: Optional[ConversationSummarizer] = None,
+                 speculative: Iterable[str] = (),
+                 max_sessions: Optional[int] = None,
+                 temperature: float = 0.7, max_tokens: int = MAX_COMPLETION_TOKENS):
+        self.client = client
+        self.registry = registry if registry is not None else PromptRegistry(personalities_dict)
+        self.response_cache = response_cache
+        self.preflight_stats = preflight_stats
+        self.router = router
+        self.store = store if store is not None else ConversationStore()
+        self.classifier = classifier
+        self.coalescer = coalescer
+        self.metrics = metrics
+        self.profiler = profiler
+        self.summarizer = summarizer
+        # Personalities ("*" for all) whose pre-flight check runs alongside the Groq request
+        self.speculative = frozenset(speculative)
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        # Per-session reply state for the most recently used sessions, bounded like the store's window cache
+        self.max_sessions = max_sessions if max_sessions is not None else getattr(self.store, "max_sessions", 1000)
+        self.sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._summary_tasks: Dict[str, asyncio.Task] = {}
+
+    @property
+    def personalities_dict(self) -> Dict[str, Any]:
+        """Current personality definitions from the prompt registry"""
+        return self.registry.personalities
+
+    def _session(self, session_id: str) -> Dict[str, Any]:
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self.sessions.move_to_end(session_id)
+            return session
+        session = {"cancel": None, "last_turn": None}
+        self.sessions[session_id] = session
+        excess = len(self.sessions) - self.max_sessions
+        if excess > 0:
+            # Sessions with a reply streaming stay, so they can still be cancelled
+            idle = [sid for sid, state in self.sessions.items() if state["cancel"] is None and sid != session_id]
+            for sid in idle[:excess]:
+                del self.sessions[sid]
+        return session
+
+    def get_history(self, session_id: str) -> List[Dict[str, Any]]:
+        """Get the recent messages of a session, oldest first"""
+        return self.store.recent(session_id)
+
+    def get_older_history(self, session_id: str, before_seq: int, limit: int = 20) -> List[Dict[str, Any]]:
+        """Get messages older than ``before_seq`` from the conversation store"""
+        return self.store.load_older(session_id, before_seq, limit)
+
+    def get_last_turn(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get details of the latest reply: source, model, timings and a 'context'
+        dictionary with the 'tokens', 'budget' and 'dropped' counts of what was sent
+        """
+        return self._session(session_id)["last_turn"]
+
+    def append_message(self, session_id: str, role: str, content: str) -> None:
+        """Add a message to a session without calling the model"""
+        self.store.append(session_id, role, content)
+
+    def get_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get the rolling summary of a session's older turns, if one has been built"""
+        return self.store.get_summary(session_id)
+
+    async def _io(self, target, function, *args):
+        """Call a store or cache method, in a worker thread if ``target`` does blocking I/O (shared state)"""
+        if getattr(target, "blocking", False):
+            return await asyncio.to_thread(function, *args)
+        return function(*args)
+
+    async def clear_session(self, session_id: str) -> None:
+        """Cancel any reply or summary update in progress and drop the session's history, including fan-out threads"""
+        fan_out_ids = [fan_out_session_id(session_id, name) for name in self.registry.names]
+        for sid in [session_id] + fan_out_ids:
+            self.cancel(sid)
+            self.sessions.pop(sid, None)
+            task = self._summary_tasks.pop(sid, None)
+            if task is not None:
+                task.cancel()
+        await self._io(self.store, self.store.clear, session_id, *fan_out_ids)
+
+    def cancel(self, session_id: str) -> bool:
+        """
+        Stop the reply currently streaming for a session.
+
+        Must be called from the engine's event loop; use
+        BackgroundLoop.call to cancel from another thread.
+
+        Returns:
+            True if a reply was in progress
+        """
+        session = self.sessions.get(session_id)
+        if session is None or session["cancel"] is None:
+            return False
+        session["cancel"].set()
+        return True
+
+    async def stream_reply(self, session_id: str, prompt: str, personality: str, model: str,
+                           preflight: bool = False, coalesce: bool = True) -> AsyncIterator[str]:
+        """
+        Add a user prompt to a session and stream the assistant's reply.
+
+        The reply is served, in order of preference, from the pre-flight
+        refusal gate (when enabled), the response cache, an identical
+        request that is already streaming (when a coalescer is set), or a
+        new Groq stream. The completed reply is appended to the session
+        history; a cancelled reply keeps whatever text was streamed before
+        cancellation. In auto mode a model that fails before streaming any
+        text is failed over to the router's next choice.
+
+        For personalities in ``speculative`` the pre-flight check runs in a
+        worker thread while the upstream request is already open; chunks
+        are held back until the verdict arrives and the request is
+        cancelled on a refusal. With a summarizer,
+        turns covered by the session's rolling summary are sent as that
+        summary, and the summary is updated in the background once the
+        reply has finished.
+
+        Args:
+            session_id: Identifier of the conversation
+            prompt: The new user message
+            personality: The selected personality
+            model: Groq model id, or AUTO_MODEL to let the router pick
+            preflight: Whether to run the local pre-flight refusal gate first
+            coalesce: Whether this request may share an identical in-flight stream
+
+        Returns:
+            Async iterator of response text chunks
+        """
+        session = self._session(session_id)
+        if session["cancel"] is not None:
+            session["cancel"].set()
+        cancel_event = asyncio.Event()
+        session["cancel"] = cancel_event
+        user_message = await self._io(self.store, self.store.append, session_id, "user", prompt)
+        history = await self._io(self.store, self.store.recent, session_id)
+        summary = None
+        if self.summarizer is not None:
+            summary = await self._io(self.store, self.store.get_summary, session_id)
+            # A summary that covers the new prompt is left over from before a clear
+            if summary is not None and summary["through_seq"] >= user_message["seq"]:
+                summary = None
+            if summary is not None:
+                history = [message for message in history if message["seq"] > summary["through_seq"]]
+        turn = {"source": None, "model": model, "context": None, "started": time.perf_counter(),
+                "first_token": None, "finished": None}
+        session["last_turn"] = turn
+
+        full_response = []
+        error = None
+        profile = self.profiler.start(f"{personality}-{model}") if self.profiler is not None else None
+        check = None
+        try:
+            if preflight and is_speculative(self.speculative, personality):
+                check = asyncio.ensure_future(asyncio.to_thread(
+                    self._check_boundary, prompt, personality, self.personalities_dict, True
+                ))
+            elif preflight:
+                result = self._check_boundary(prompt, personality, self.personalities_dict)
+                if result["decision"] == REFUSE:
+                    turn["source"] = "preflight"
+                    turn["first_token"] = time.perf_counter()
+                    full_response.append(result["response"])
+                    yield result["response"]
+                    return
+
+            with self.metrics.time("chat_prompt_assembly_seconds", personality=personality):
+                system = self.registry.get(personality)
+                system_prompt = system["message"]["content"]
+                requested_model = model
+                auto = model == AUTO_MODEL
+                if auto:
+                    prompt_tokens = system["tokens"] + sum(message["tokens"] for message in history)
+                    if summary is not None:
+                        prompt_tokens += summary["tokens"]
+                    model = self.router.choose(prompt_tokens)
+                context = build_context(system_prompt, history, model, system["tokens"], summary)
+                turn["model"] = model
+                turn["context"] = context
+
+            cache_key = None
+            if self.response_cache is not None:
+                cache_key = make_cache_key(system["hash"], model, prompt, context["messages"][1:-1])
+                cached_response = await self._io(self.response_cache, self.response_cache.get, cache_key)
+                if cached_response is not None:
+                    if check is not None and (await check)["decision"] == REFUSE:
+                        turn["source"] = "preflight"
+                        turn["first_token"] = time.perf_counter()
+                        full_response.append(check.result()["response"])
+                        yield check.result()["response"]
+                        return
+                    turn["source"] = "cache"
+                    turn["first_token"] = time.perf_counter()
+                    for chunk in iter_replay_chunks(cached_response):
+                        if cancel_event.is_set():
+                            return
+                        full_response.append(chunk)
+                        yield chunk
+                    return
+
+            request_start = time.perf_counter()
+            leader = True
+            if self.coalescer is not None and coalesce:
+                # The key covers the full history, so only sessions with identical histories share a stream
+                pinned = [summary_message(summary)] if summary is not None else []
+                flight_key = make_cache_key(system["hash"], requested_model, prompt, pinned + history[:-1])
+                flight, leader = self.coalescer.join(
+                    flight_key,
+                    lambda: self._upstream(model, auto, system, history, summary, asyncio.Event(), turn)
+                )
+                stream = flight.subscribe()
+            else:
+                stream = self._upstream(model, auto, system, history, summary, cancel_event, turn)
+
+            turn["source"] = "groq" if leader else "coalesced"
+            if check is not None:
+                stream = self._speculate(stream, check, personality, turn)
+            try:
+                async for content in stream:
+                    if cancel_event.is_set():
+                        return
+                    if turn["first_token"] is None:
+                        turn["first_token"] = time.perf_counter()
+                    full_response.append(content)
+                    yield content
+            finally:
+                await stream.aclose()
+
+            if cancel_event.is_set() or not leader or turn["source"] == "preflight":
+                return
+            self.preflight_stats.record_upstream(time.perf_counter() - request_start)
+            text = "".join(full_response)
+            if cache_key is not None:
+                from src.utils import validate_groq_response
+                if validate_groq_response(text):
+                    cache_history = turn["context"]["messages"][1:-1]
+                    await self._io(self.response_cache, self.response_cache.set,
+                                   make_cache_key(system["hash"], turn["model"], prompt, cache_history), text)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            if check is not None and not check.done():
+                check.cancel()
+            if turn["context"] is not None:
+                # Only the counts outlive the request; the API payload would pin every session's history
+                turn["context"] = {name: turn["context"][name] for name in ("tokens", "budget", "dropped")}
+            turn["finished"] = time.perf_counter()
+            if session["cancel"] is cancel_event:
+                session["cancel"] = None
+            if full_response:
+                await self._io(self.store, self.store.append, session_id, "assistant", "".join(full_response))
+                if self.summarizer is not None and error is None:
+                    self._schedule_summary(session_id)
+            if self.profiler is not None:
+                self.profiler.stop(profile)
+            if self.metrics.enabled:
+                self._record_metrics(turn, personality, len(full_response), error)
+
+    def _check_boundary(self, prompt: str, personality: str, personalities_dict: Dict[str, Any],
+                        speculative: bool = False) -> Dict[str, Any]:
+        """Run the pre-flight check and time it; safe to call from a worker thread"""
+        with self.metrics.time("chat_boundary_check_seconds", personality=personality):
+            return run_preflight(prompt, personality, personalities_dict, self.preflight_stats, self.classifier,
+                                 speculative)
+
+    async def _speculate(self, stream: AsyncIterator[str], check: "asyncio.Future[Dict[str, Any]]",
+                         personality: str, turn: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Hold back a speculative upstream stream until the pre-flight verdict.
+
+        Chunks that arrive before the verdict are buffered. On a refusal the
+        stream is closed, which cancels the upstream request, and the refusal
+        is yielded instead; the prompt tokens, chunks and time spent on the
+        cancelled request are recorded as waste. An upstream error before
+        the verdict is only raised if the prompt was not refused.
+        """
+        start = time.perf_counter()
+        buffered = []
+        failure = None
+        pending = asyncio.ensure_future(stream.__anext__())
+        try:
+            while not check.done():
+                done, _ = await asyncio.wait({pending, check}, return_when=asyncio.FIRST_COMPLETED)
+                if pending not in done:
+                    continue
+                try:
+                    buffered.append(pending.result())
+                except StopAsyncIteration:
+                    pending = None
+                    break
+                except Exception as e:
+                    failure, pending = e, None
+                    break
+                pending = asyncio.ensure_future(stream.__anext__())
+
+            result = await check
+            if result["decision"] == REFUSE:
+                wasted_seconds = time.perf_counter() - start
+                self.preflight_stats.record_speculation(
+                    personality, REFUSE, result["seconds"],
+                    wasted_prompt_tokens=turn["context"]["tokens"] if turn["source"] == "groq" else 0,
+                    wasted_tokens=len(buffered), wasted_seconds=wasted_seconds
+                )
+                self.metrics.inc("chat_speculation_total", personality=personality, decision=REFUSE)
+                self.metrics.inc("chat_speculation_wasted_tokens_total", len(buffered), personality=personality)
+                turn["source"] = "preflight"
+                turn["first_token"] = time.perf_counter()
+                yield result["response"]
+                return
+
+            self.preflight_stats.record_speculation(personality, result["decision"], result["seconds"])
+            self.metrics.inc("chat_speculation_total", personality=personality, decision=result["decision"])
+            if failure is not None:
+                raise failure
+            if buffered:
+                turn["first_token"] = time.perf_counter()
+            for chunk in buffered:
+                yield chunk
+            if pending is not None:
+                try:
+                    chunk = await pending
+                except StopAsyncIteration:
+                    return
+                finally:
+                    pending = None
+                yield chunk
+                async for chunk in stream:
+                    yield chunk
+        finally:
+            if pending is not None:
+                pending.cancel()
+                await asyncio.gather(pending, return_exceptions=True)
+            await stream.aclose()
+
+    def _schedule_summary(self, session_id: str) -> None:
+        """Start a background summary update unless one is already running for the session"""
+        if session_id in self._summary_tasks:
+            return
+        self._summary_tasks[session_id] = asyncio.ensure_future(self._update_summary(session_id))
+
+    async def _update_summary(self, session_id: str) -> None:
+        """
+        Fold older messages into the session's summary if its unsummarized history is over
+        the threshold; failures keep the old summary and are only counted
+        """
+        outcome = "error"
+        try:
+            summary = await self._io(self.store, self.store.get_summary, session_id)
+            messages = self.summarizer.pending(await self._io(self.store, self.store.recent, session_id), summary)
+            if not messages:
+                outcome = None
+                return
+            previous = summary["content"] if summary is not None else None
+            with self.metrics.time("chat_summary_seconds", model=self.summarizer.model):
+                summary = await self.summarizer.summarize(previous, messages)
+            await self._io(self.store, self.store.set_summary, session_id, summary, messages[-1]["seq"])
+            outcome = "success"
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception:
+            pass
+        finally:
+            if self._summary_tasks.get(session_id) is asyncio.current_task():
+                del self._summary_tasks[session_id]
+            if outcome is not None:
+                self.metrics.inc("chat_summaries_total", outcome=outcome)
+
+    def _record_metrics(self, turn: Dict[str, Any], personality: str, chunks: int, error: Optional[str]) -> None:
+        """Record a finished turn's latency, size and outcome"""
+        labels = {"personality": personality, "model": turn["model"]}
+        if error is not None:
+            self.metrics.inc("chat_errors_total", error=error, **labels)
+            return
+        labels["source"] = turn["source"]
+        self.metrics.inc("chat_requests_total", **labels)
+        if turn["first_token"] is not None:
+            self.metrics.observe("chat_ttft_seconds", turn["first_token"] - turn["started"], **labels)
+        self.metrics.observe("chat_stream_seconds", turn["finished"] - turn["started"], **labels)
+        self.metrics.observe("chat_response_tokens", chunks, **labels)
+
+    async def stream_fan_out(self, session_id: str, prompt: str, personalities: List[str], model: str,
+                             max_concurrency: int = 3, preflight: bool = False) -> AsyncIterator[Tuple[str, str, Any]]:
+        """
+        Ask several personalities the same question and stream their replies concurrently.
+
+        Each personality answers in its own thread of the conversation (see
+        fan_out_session_id), so follow-up fan-outs keep per-persona context.
+        The prompt and the combined replies are also added to the main
+        session so they show up in its history.
+
+        Args:
+            session_id: Identifier of the conversation
+            prompt: The new user message
+            personalities: Personalities to ask
+            model: Groq model id, or AUTO_MODEL
+            max_concurrency: Maximum number of Groq streams open at once for this request
+            preflight: Whether to run the local pre-flight refusal gate per personality
+
+        Returns:
+            Async iterator of (event, personality, value) tuples from merge_streams
+        """
+        await self._io(self.store, self.store.append, session_id, "user", prompt)
+        replies = {name: [] for name in personalities}
+        streams = {
+            name: (lambda name=name: self.stream_reply(fan_out_session_id(session_id, name), prompt, name, model,
+                                                       preflight))
+            for name in personalities
+        }
+        try:
+            async for event in merge_streams(streams, max_concurrency):
+                if event[0] == CHUNK:
+                    replies[event[1]].append(event[2])
+                yield event
+        finally:
+            combined = "\n\n".join(f"**{name}:** {''.join(chunks)}" for name, chunks in replies.items() if chunks)
+            if combined:
+                await self._io(self.store, self.store.append, session_id, "assistant", combined)
+
+    async def _upstream(self, model: str, auto: bool, system: Dict[str, Any], history: List[Dict[str, Any]],
+                        summary: Optional[Dict[str, Any]], cancel_event: asyncio.Event,
+                        turn: Dict[str, Any]) -> AsyncIterator[str]:
+        """Stream a reply from Groq; in auto mode, fail over to the next model if nothing was streamed yet"""
+        context = turn["context"]
+        failed_models = []
+        streamed = False
+        while True:
+            try:
+                async for content in self._stream_model(model, context["messages"], cancel_event, turn):
+                    streamed = True
+                    yield content
+                return
+            except Exception:
+                failed_models.append(model)
+                fallbacks = self.router.ranked(context["tokens"], exclude=failed_models) if auto else []
+                if streamed or not fallbacks:
+                    raise
+                model = fallbacks[0]
+                context = build_context(system["message"]["content"], history, model, system["tokens"], summary)
+                turn["model"] = model
+                turn["context"] = context
+
+    async def _stream_model(self, model: str, messages: List[Dict[str, str]], cancel_event: asyncio.Event,
+                            turn: Dict[str, Any]) -> AsyncIterator[str]:
+        """Stream one Groq completion and feed its latency into the router"""
+        self.router.record_start(model)
+        outcome = None
+        start = time.perf_counter()
+        first_token = None
+        tokens = 0
+        try:
+            stream = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                stream=True,
+            )
+            try:
+                async for chunk in stream:
+                    if cancel_event.is_set():
+                        return
+                    content = chunk.choices[0].delta.content if chunk.choices else None
+                    if content:
+                        if first_token is None:
+                            first_token = time.perf_counter()
+                            turn["first_token"] = first_token
+                        tokens += 1
+                        yield content
+            finally:
+                await stream.close()
+            outcome = "success"
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            if outcome == "success" and first_token is not None:
+                self.router.record_success(model, first_token - start, tokens, time.perf_counter() - first_token)
+            elif outcome == "error":
+                self.router.record_error(model)
+            else:
+                self.router.record_cancel(model)
+
+    async def reply(self, session_id: str, prompt: str, personality: str, model: str,
+                    preflight: bool = False, coalesce: bool = True) -> str:
+        """Collect a full reply; convenience wrapper around stream_reply"""
+        chunks = []
+        async for chunk in self.stream_reply(session_id, prompt, personality, model, preflight, coalesce):
+            chunks.append(chunk)
+        return "".join(chunks)
+
+
+class BackgroundLoop:
+    """Event loop running in a daemon thread, for driving the engine from sync code"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="chat-engine-loop", daemon=True)
+        self._thread.start()
+
+    def run(self, coroutine, timeout: Optional[float] = None):
+        """Run a coroutine on the loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def call(self, callback, *args):
+        """Run a plain callable on the loop and wait for its result"""
+        async def _call():
+            return callback(*args)
+        return self.run(_call())
+
+    def call_soon(self, callback, *args) -> None:
+        """Schedule a plain callback on the loop from another thread"""
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def iterate(self, async_iterator: AsyncIterator[Any]) -> Iterator[Any]:
+        """
+        Consume an async iterator from synchronous code.
+
+        If the consumer stops early (e.g. a Streamlit rerun interrupts the
+        script), the async iterator is closed on the loop so upstream streams
+        are released.
+        """
+        try:
+            while True:
+                try:
+                    yield self.run(async_iterator.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(async_iterator.aclose())
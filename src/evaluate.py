@@ -0,0 +1,381 @@
+"""
+Offline personality-adherence evaluation across models
+
+Runs every (prompt, personality, model) combination from a prompt corpus
+against Groq (or a local mock), checks whether each reply stays in the
+personality's domain or refuses as expected, and reports adherence,
+latency and token aggregates per personality and model.
+
+The corpus is JSONL or CSV with a ``prompt`` field and an optional
+``domain`` field naming the personality the prompt belongs to (empty for
+prompts that fit no personality). A personality is expected to answer
+prompts in its own domain and refuse everything else.
+
+Usage:
+    python -m src.evaluate corpus.jsonl --output results.parquet [--concurrency 8]
+        [--model llama-3.1-8b-instant] [--personality Chef] [--base-url http://127.0.0.1:8787]
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.cache import normalize_prompt
+from src.context import estimate_tokens
+
+ANSWER = "answer"
+REFUSE = "refuse"
+
+# Phrases that mark a refusal even when the model paraphrases the refuse_message
+REFUSAL_MARKERS = (
+    "i'm specifically a",
+    "i am specifically a",
+    "can only help with",
+    "i can only answer",
+    "outside my area",
+    "outside of my expertise",
+)
+
+RESULT_COLUMNS = [
+    "job", "id", "personality", "model", "domain", "expected", "refused", "adherent",
+    "ttft", "latency", "prompt_tokens", "completion_tokens", "error", "reply",
+]
+
+
+def iter_corpus(path: str) -> Iterator[Dict[str, str]]:
+    """
+    Read corpus records from a JSONL or CSV file.
+
+    Args:
+        path: Path to a .jsonl or .csv file
+
+    Returns:
+        Iterator of dictionaries with 'id', 'prompt' and 'domain' keys
+    """
+    with open(path, newline="", encoding="utf-8") as handle:
+        if path.endswith(".csv"):
+            records = csv.DictReader(handle)
+        else:
+            records = (json.loads(line) for line in handle if line.strip())
+        for index, record in enumerate(records):
+            prompt = record.get("prompt") or ""
+            if prompt:
+                yield {
+                    "id": str(record.get("id") or index),
+                    "prompt": prompt,
+                    "domain": record.get("domain") or "",
+                }
+
+
+def build_jobs(corpus: List[Dict[str, str]], personalities: List[str], models: List[str]) -> List[Dict[str, Any]]:
+    """One job per (prompt, personality, model), keyed so a run can be resumed"""
+    return [
+        {
+            "job": f"{record['id']}|{personality}|{model}",
+            "id": record["id"],
+            "prompt": record["prompt"],
+            "domain": record["domain"],
+            "personality": personality,
+            "model": model,
+            "expected": ANSWER if record["domain"] == personality else REFUSE,
+        }
+        for record in corpus
+        for personality in personalities
+        for model in models
+    ]
+
+
+def is_refusal(reply: str, refuse_message: str) -> bool:
+    """
+    Check whether a reply declines the question.
+
+    Looks for the start of the personality's refuse_message or a common
+    refusal phrase near the beginning of the reply.
+
+    Args:
+        reply: Model reply
+        refuse_message: The personality's configured refusal text
+    """
+    head = normalize_prompt(reply[:400])
+    signature = normalize_prompt(refuse_message)[:60]
+    return bool(signature and signature in head) or any(marker in head for marker in REFUSAL_MARKERS)
+
+
+async def run_job(client, registry, job: Dict[str, Any], max_tokens: int, temperature: float) -> Dict[str, Any]:
+    """Send one single-turn request and score the reply"""
+    system = registry.get(job["personality"])
+    result = {column: job.get(column) for column in RESULT_COLUMNS}
+    result.update(refused=None, adherent=None, ttft=None, latency=None, completion_tokens=None, error="", reply="")
+    result["prompt_tokens"] = system["tokens"] + estimate_tokens(job["prompt"])
+
+    chunks = []
+    usage = None
+    start = time.perf_counter()
+    try:
+        stream = await client.chat.completions.create(
+            model=job["model"],
+            messages=[system["message"], {"role": "user", "content": job["prompt"]}],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        try:
+            async for chunk in stream:
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                if content:
+                    if not chunks:
+                        result["ttft"] = time.perf_counter() - start
+                    chunks.append(content)
+                x_groq = getattr(chunk, "x_groq", None)
+                if x_groq is not None and getattr(x_groq, "usage", None) is not None:
+                    usage = x_groq.usage
+        finally:
+            await stream.close()
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"[:300]
+        result["latency"] = time.perf_counter() - start
+        return result
+
+    reply = "".join(chunks)
+    result["latency"] = time.perf_counter() - start
+    result["reply"] = reply
+    if usage is not None and getattr(usage, "prompt_tokens", 0):
+        result["prompt_tokens"] = usage.prompt_tokens
+    result["completion_tokens"] = (getattr(usage, "completion_tokens", None) if usage is not None else None) \
+        or estimate_tokens(reply)
+    refuse_message = registry.personalities[job["personality"]].get("refuse_message", "")
+    result["refused"] = is_refusal(reply, refuse_message)
+    result["adherent"] = result["refused"] == (job["expected"] == REFUSE)
+    return result
+
+
+def load_checkpoint(path: str) -> Dict[str, Dict[str, Any]]:
+    """Read finished results from a checkpoint file, keyed by job; a torn last line is ignored"""
+    finished = {}
+    if not os.path.exists(path):
+        return finished
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            finished[result["job"]] = result
+    return finished
+
+
+async def run_evaluation(client, registry, jobs: List[Dict[str, Any]], checkpoint_path: str,
+                         concurrency: int = 8, max_tokens: int = 256, temperature: float = 0.0,
+                         retry_errors: bool = False, progress=None) -> List[Dict[str, Any]]:
+    """
+    Run jobs with bounded parallelism, appending each result to a checkpoint.
+
+    Jobs already in the checkpoint are skipped (failed ones too, unless
+    ``retry_errors``), so an interrupted run picks up where it stopped.
+
+    Args:
+        client: AsyncGroq-compatible client (e.g. GroqClientPool)
+        registry: PromptRegistry providing the system messages
+        jobs: Jobs from build_jobs
+        checkpoint_path: JSONL file results are appended to
+        concurrency: Maximum number of requests in flight
+        max_tokens: Completion token limit per request
+        temperature: Sampling temperature
+        retry_errors: Re-run jobs that failed in an earlier run
+        progress: Optional callable(done, total) invoked after each result
+
+    Returns:
+        Results for every job, in job order
+    """
+    finished = load_checkpoint(checkpoint_path)
+    if retry_errors:
+        finished = {key: result for key, result in finished.items() if not result.get("error")}
+    pending = [job for job in jobs if job["job"] not in finished]
+
+    queue = asyncio.Queue()
+    for job in pending:
+        queue.put_nowait(job)
+    done = len(jobs) - len(pending)
+
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        async def worker():
+            nonlocal done
+            while True:
+                try:
+                    job = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                result = await run_job(client, registry, job, max_tokens, temperature)
+                finished[job["job"]] = result
+                checkpoint.write(json.dumps(result) + "\n")
+                checkpoint.flush()
+                done += 1
+                if progress is not None:
+                    progress(done, len(jobs))
+
+        await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(pending))))))
+
+    return [finished[job["job"]] for job in jobs]
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Aggregate results per (personality, model).
+
+    Returns:
+        One dictionary per group with request/error counts, adherence and
+        false-refusal/false-answer rates, latency and TTFT percentiles and
+        token totals
+    """
+    groups = {}
+    for result in results:
+        groups.setdefault((result["personality"], result["model"]), []).append(result)
+
+    summary = []
+    for (personality, model), group in sorted(groups.items()):
+        scored = [result for result in group if not result["error"]]
+        should_answer = [result for result in scored if result["expected"] == ANSWER]
+        should_refuse = [result for result in scored if result["expected"] == REFUSE]
+        latencies = [result["latency"] for result in scored]
+        ttfts = [result["ttft"] for result in scored if result["ttft"] is not None]
+        summary.append({
+            "personality": personality,
+            "model": model,
+            "requests": len(group),
+            "errors": len(group) - len(scored),
+            "adherence": sum(result["adherent"] for result in scored) / len(scored) if scored else None,
+            "false_refusal_rate": (sum(result["refused"] for result in should_answer) / len(should_answer)
+                                   if should_answer else None),
+            "false_answer_rate": (sum(not result["refused"] for result in should_refuse) / len(should_refuse)
+                                  if should_refuse else None),
+            "latency_p50": _percentile(latencies, 0.50),
+            "latency_p95": _percentile(latencies, 0.95),
+            "ttft_p50": _percentile(ttfts, 0.50),
+            "prompt_tokens": sum(result["prompt_tokens"] or 0 for result in group),
+            "completion_tokens": sum(result["completion_tokens"] or 0 for result in scored),
+        })
+    return summary
+
+
+def write_results(results: List[Dict[str, Any]], path: str, keep_replies: bool = False) -> None:
+    """
+    Write results as Parquet (.parquet), Arrow IPC (.arrow/.feather) or CSV.
+
+    Parquet and Arrow need pyarrow. Reply text is dropped unless keep_replies.
+    """
+    columns = [column for column in RESULT_COLUMNS if keep_replies or column != "reply"]
+    if path.endswith((".parquet", ".arrow", ".feather")):
+        import pyarrow as pa
+
+        table = pa.Table.from_pydict({column: [result.get(column) for result in results] for column in columns})
+        if path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            pq.write_table(table, path, compression="zstd")
+        else:
+            import pyarrow.feather as feather
+            feather.write_feather(table, path, compression="zstd")
+        return
+
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        writer = csv.DictWriter(handle, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        for result in results:
+            writer.writerow({
+                column: (round(value, 4) if isinstance(value, float) else value)
+                for column, value in result.items() if column in columns
+            })
+
+
+def _format(value, pattern: str) -> str:
+    if value is None:
+        return "-".rjust(int(pattern.split(".")[0]))
+    return format(value, pattern)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from src.client_pool import GroqClientPool
+    from src.models import MODEL_OPTIONS
+    from src.personalities import PromptRegistry
+
+    parser = argparse.ArgumentParser(description="Evaluate personality adherence across models")
+    parser.add_argument("corpus", help="JSONL or CSV file with 'prompt' and optional 'domain' and 'id'")
+    parser.add_argument("--output", default="eval_results.csv", help=".parquet, .arrow or .csv")
+    parser.add_argument("--checkpoint", help="results log used to resume (default: <output>.partial.jsonl)")
+    parser.add_argument("--model", action="append", dest="models", help="model to test (repeatable, default: all)")
+    parser.add_argument("--personality", action="append", dest="personalities",
+                        help="personality to test (repeatable, default: all)")
+    parser.add_argument("--personalities-dir", help="also load personalities from this JSON/YAML directory")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--temperature", type=float, default=0.0)
+    parser.add_argument("--limit", type=int, help="only use the first N prompts")
+    parser.add_argument("--retry-errors", action="store_true", help="re-run jobs that failed in an earlier run")
+    parser.add_argument("--keep-replies", action="store_true", help="include reply text in the output")
+    parser.add_argument("--base-url", help="Groq-compatible endpoint, e.g. the local mock server")
+    parser.add_argument("--requests-per-minute", type=float, default=30)
+    parser.add_argument("--tokens-per-minute", type=float, default=6000)
+    parser.add_argument("--summary", help="also write the aggregates as JSON")
+    args = parser.parse_args(argv)
+
+    api_keys = [key.strip() for key in (os.getenv("GROQ_API_KEYS") or os.getenv("GROQ_API_KEY") or "").split(",")]
+    api_keys = [key for key in api_keys if key]
+    if not api_keys:
+        if not args.base_url:
+            parser.error("set GROQ_API_KEY (or GROQ_API_KEYS), or pass --base-url for a mock server")
+        api_keys = ["mock"]
+
+    registry = PromptRegistry(directory=args.personalities_dir)
+    personalities = args.personalities or registry.names
+    models = args.models or list(MODEL_OPTIONS.values())
+    corpus = list(iter_corpus(args.corpus))[:args.limit]
+    jobs = build_jobs(corpus, personalities, models)
+    checkpoint_path = args.checkpoint or f"{args.output}.partial.jsonl"
+
+    client = GroqClientPool(api_keys, requests_per_minute=args.requests_per_minute,
+                            tokens_per_minute=args.tokens_per_minute, base_url=args.base_url)
+
+    def progress(done, total):
+        if done % 50 == 0 or done == total:
+            print(f"\r{done}/{total} requests", end="", file=sys.stderr, flush=True)
+
+    async def run():
+        try:
+            return await run_evaluation(client, registry, jobs, checkpoint_path, args.concurrency,
+                                        args.max_tokens, args.temperature, args.retry_errors, progress)
+        finally:
+            await client.close()
+
+    start = time.perf_counter()
+    results = asyncio.run(run())
+    print(f"\n{len(jobs)} requests in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    write_results(results, args.output, args.keep_replies)
+    summary = summarize(results)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as handle:
+            json.dump(summary, handle, indent=2)
+
+    print(f"{'personality':>14} {'model':>26} {'n':>5} {'err':>4} {'adhere':>7} {'f.refuse':>8} {'f.answer':>8} "
+          f"{'p50 s':>6} {'p95 s':>6} {'tokens':>8}")
+    for row in summary:
+        print(f"{row['personality']:>14} {row['model']:>26} {row['requests']:>5} {row['errors']:>4} "
+              f"{_format(row['adherence'], '7.1%')} {_format(row['false_refusal_rate'], '8.1%')} "
+              f"{_format(row['false_answer_rate'], '8.1%')} {_format(row['latency_p50'], '6.2f')} "
+              f"{_format(row['latency_p95'], '6.2f')} {row['prompt_tokens'] + row['completion_tokens']:>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
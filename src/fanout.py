@@ -0,0 +1,90 @@
+"""
+Multi-personality fan-out: pick several personas and stream their replies concurrently
+"""
+
+import asyncio
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+CHUNK = "chunk"
+DONE = "done"
+ERROR = "error"
+
+
+def select_personalities(user_input: str, personalities_dict: Dict[str, Any], limit: int = 3,
+                         fallback: Optional[str] = None, classifier=None) -> List[str]:
+    """
+    Pick the personalities whose domains best match a message.
+
+    Candidates are ranked by their number of distinct domain-term hits
+    (generic question stems do not count), with the semantic classifier's
+    score, when one is given, breaking ties and adding personalities it is
+    confident about. Only then is the limit applied.
+
+    Args:
+        user_input: The user's message
+        personalities_dict: Dictionary of all personalities
+        limit: Maximum number of personalities to return
+        fallback: Personality to use when none match
+        classifier: Optional SemanticClassifier
+
+    Returns:
+        Matching personality names, best first, or [fallback] if none match
+    """
+    from src.utils import domain_match_scores
+
+    hits = domain_match_scores(user_input, personalities_dict, ranking=True)
+    semantic = classifier.score(user_input) if classifier is not None else {}
+    min_score = getattr(classifier, "min_score", 0.0)
+    candidates = [name for name in personalities_dict
+                  if hits.get(name) or semantic.get(name, 0.0) >= max(min_score, 1e-9)]
+    candidates.sort(key=lambda name: (hits.get(name, 0), semantic.get(name, 0.0)), reverse=True)
+    selected = candidates[:limit]
+    if not selected and fallback is not None:
+        selected = [fallback]
+    return selected
+
+
+async def merge_streams(streams: Dict[str, Callable[[], AsyncIterator[str]]],
+                        max_concurrency: int = 3) -> AsyncIterator[Tuple[str, str, Any]]:
+    """
+    Run several async streams concurrently and interleave their output.
+
+    At most ``max_concurrency`` streams are open at once; the rest wait for
+    a slot. If the consumer stops early, every running stream is cancelled
+    and closed.
+
+    Args:
+        streams: Name -> callable opening that stream
+        max_concurrency: Cap on simultaneously open streams
+
+    Returns:
+        Async iterator of (event, name, value) tuples: (CHUNK, name, text),
+        (DONE, name, None) when a stream ends, or (ERROR, name, exception)
+    """
+    queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def pump(name, open_stream):
+        async with semaphore:
+            try:
+                async with aclosing(open_stream()) as stream:
+                    async for chunk in stream:
+                        await queue.put((CHUNK, name, chunk))
+            except Exception as e:
+                await queue.put((ERROR, name, e))
+                return
+        await queue.put((DONE, name, None))
+
+    tasks = [asyncio.ensure_future(pump(name, open_stream)) for name, open_stream in streams.items()]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            event = await queue.get()
+            if event[0] != CHUNK:
+                remaining -= 1
+            yield event
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
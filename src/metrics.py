@@ -0,0 +1,315 @@
+"""
+Lightweight metrics (counters, histograms, timers) for the chat pipeline
+"""
+
+import bisect
+import json
+import os
+import random
+import threading
+import time
+import warnings
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+COUNTER = "counter"
+HISTOGRAM = "histogram"
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048)
+
+# Metrics recorded by the engine and the app: (name, type, help, buckets)
+CHAT_METRICS = [
+    ("chat_requests_total", COUNTER, "Chat replies by personality, model and source", None),
+    ("chat_errors_total", COUNTER, "Failed chat replies by error class", None),
+    ("chat_client_init_seconds", HISTOGRAM, "Time to create the Groq clients (connect)", LATENCY_BUCKETS),
+    ("chat_prompt_assembly_seconds", HISTOGRAM, "Time to build the system prompt and context", LATENCY_BUCKETS),
+    ("chat_boundary_check_seconds", HISTOGRAM, "Time spent in the pre-flight boundary check", LATENCY_BUCKETS),
+    ("chat_ttft_seconds", HISTOGRAM, "Time from prompt to first reply chunk", LATENCY_BUCKETS),
+    ("chat_stream_seconds", HISTOGRAM, "Time from prompt to the end of the reply", LATENCY_BUCKETS),
+    ("chat_response_tokens", HISTOGRAM, "Streamed chunks (approximate tokens) per reply", TOKEN_BUCKETS),
+    ("chat_render_flushes_total", COUNTER, "Markdown re-renders while streaming replies", None),
+    ("chat_speculation_total", COUNTER, "Speculative requests by pre-flight verdict", None),
+    ("chat_speculation_wasted_tokens_total", COUNTER, "Chunks streamed by speculative requests later refused", None),
+    ("chat_summaries_total", COUNTER, "Background conversation summary updates by outcome", None),
+    ("chat_summary_seconds", HISTOGRAM, "Time to update a conversation summary", LATENCY_BUCKETS),
+]
+
+
+class _Timer:
+    def __init__(self, registry, name: str, labels: Dict[str, Any]):
+        self._registry = registry
+        self._name = name
+        self._labels = labels
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._registry.observe(self._name, time.perf_counter() - self._start, **self._labels)
+        return False
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def _label_key(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(label_key, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store of labelled counters and histograms.
+
+    When disabled every recording call returns immediately and timers are a
+    shared no-op context manager, so instrumented code costs one attribute
+    check. Export with render_prometheus() or snapshot().
+    """
+
+    def __init__(self, enabled: bool = False, definitions=CHAT_METRICS):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Dict[str, Any]] = {}
+        for name, kind, help_text, buckets in definitions:
+            self.define(name, kind, help_text, buckets)
+
+    def define(self, name: str, kind: str, help_text: str = "", buckets: Optional[Iterable[float]] = None) -> None:
+        """Declare a metric so it is exported with its help text"""
+        with self._lock:
+            self._metrics.setdefault(name, {
+                "type": kind,
+                "help": help_text,
+                "buckets": tuple(buckets or LATENCY_BUCKETS) if kind == HISTOGRAM else None,
+                "series": {},
+            })
+
+    def _metric(self, name: str, kind: str) -> Dict[str, Any]:
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = {
+                "type": kind, "help": "", "buckets": LATENCY_BUCKETS if kind == HISTOGRAM else None, "series": {}
+            }
+        return metric
+
+    def inc(self, name: str, amount: float = 1.0, **labels) -> None:
+        """Add to a counter"""
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._metric(name, COUNTER)["series"]
+            series[key] = series.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Record one histogram sample"""
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            metric = self._metric(name, HISTOGRAM)
+            state = metric["series"].get(key)
+            if state is None:
+                state = metric["series"][key] = {"buckets": [0] * len(metric["buckets"]), "sum": 0.0, "count": 0}
+            index = bisect.bisect_left(metric["buckets"], value)
+            if index < len(state["buckets"]):
+                state["buckets"][index] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def time(self, name: str, **labels):
+        """Context manager recording the duration of its block in a histogram"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def reset(self) -> None:
+        with self._lock:
+            for metric in self._metrics.values():
+                metric["series"] = {}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copy of every series as plain JSON-serializable data"""
+        with self._lock:
+            result = {}
+            for name, metric in self._metrics.items():
+                series = []
+                for key, state in metric["series"].items():
+                    entry = {"labels": dict(key)}
+                    if metric["type"] == COUNTER:
+                        entry["value"] = state
+                    else:
+                        entry.update(sum=state["sum"], count=state["count"],
+                                     buckets=dict(zip(map(str, metric["buckets"]), state["buckets"])))
+                    series.append(entry)
+                result[name] = {"type": metric["type"], "help": metric["help"], "series": series}
+            return {"timestamp": time.time(), "metrics": result}
+
+    def render_prometheus(self) -> str:
+        """Export every metric in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, metric in self._metrics.items():
+                lines.append(f"# HELP {name} {metric['help']}")
+                lines.append(f"# TYPE {name} {metric['type']}")
+                for key, state in metric["series"].items():
+                    if metric["type"] == COUNTER:
+                        lines.append(f"{name}{_format_labels(key)} {state}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(metric["buckets"], state["buckets"]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', str(bound))])} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {state['count']}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {state['sum']}")
+                    lines.append(f"{name}_count{_format_labels(key)} {state['count']}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+
+def start_snapshot_writer(registry: MetricsRegistry, path: str, interval: float = 15.0) -> threading.Thread:
+    """Write registry.snapshot() as JSON to ``path`` every ``interval`` seconds (daemon thread)"""
+    def write_loop():
+        while True:
+            time.sleep(interval)
+            temporary = f"{path}.tmp"
+            with open(temporary, "w", encoding="utf-8") as handle:
+                json.dump(registry.snapshot(), handle)
+            os.replace(temporary, path)
+
+    thread = threading.Thread(target=write_loop, name="metrics-snapshot", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_metrics_server(registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 9464):
+    """
+    Serve /metrics (Prometheus text) and /metrics.json from a daemon thread.
+
+    Returns:
+        The running ThreadingHTTPServer
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body = registry.render_prometheus().encode("utf-8")
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            elif self.path == "/metrics.json":
+                body = json.dumps(registry.snapshot()).encode("utf-8")
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+class RequestProfiler:
+    """
+    Profile a random sample of single requests with cProfile or pyinstrument.
+
+    Profiles cover the thread that starts them, which for the chat engine is
+    the shared event loop thread, so other sessions' work running at the
+    same time shows up too. Only one request is profiled at a time.
+    If pyinstrument is not installed, cProfile is used instead, and a profiler
+    that fails to start skips the request rather than failing it.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, directory: str = "profiles", backend: str = "cprofile"):
+        if backend not in ("cprofile", "pyinstrument"):
+            raise ValueError(f"Unknown profiler backend: {backend}")
+        if backend == "pyinstrument":
+            try:
+                import pyinstrument  # noqa: F401
+            except ImportError:
+                warnings.warn("pyinstrument is not installed; profiling with cProfile instead")
+                backend = "cprofile"
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.backend = backend
+        self.written = []
+        self._busy = threading.Lock()
+
+    def start(self, label: str = "request"):
+        """Start profiling if this request is sampled; returns a handle for stop() or None"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        try:
+            if self.backend == "pyinstrument":
+                from pyinstrument import Profiler
+                profiler = Profiler(async_mode="disabled")
+                profiler.start()
+            else:
+                import cProfile
+                profiler = cProfile.Profile()
+                profiler.enable()
+        except Exception:
+            self._busy.release()
+            return None
+        return {"profiler": profiler, "label": label, "started": time.time()}
+
+    def stop(self, handle) -> Optional[str]:
+        """
+        Stop a profile started by start() and write it to the profile directory.
+
+        Errors (e.g. an unwritable directory) only warn: the profiled request
+        has already been served. Returns the file written, or None.
+        """
+        if handle is None:
+            return None
+        profiler = handle["profiler"]
+        try:
+            if self.backend == "pyinstrument":
+                profiler.stop()
+            else:
+                profiler.disable()
+            os.makedirs(self.directory, exist_ok=True)
+            name = "".join(c if c.isalnum() or c in "-_" else "_" for c in handle["label"])
+            stem = os.path.join(self.directory, f"{int(handle['started'] * 1000)}-{name}")
+            if self.backend == "pyinstrument":
+                path = stem + ".html"
+                with open(path, "w", encoding="utf-8") as output:
+                    output.write(profiler.output_html())
+            else:
+                path = stem + ".prof"
+                profiler.dump_stats(path)
+        except Exception as e:
+            warnings.warn(f"Could not write request profile: {type(e).__name__}: {e}")
+            return None
+        finally:
+            self._busy.release()
+        self.written.append(path)
+        return path
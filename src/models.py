@@ -0,0 +1,24 @@
+"""
+Groq model definitions shared by the app and the request path
+"""
+
+# Sidebar label -> Groq model id
+MODEL_OPTIONS = {
+    "LLaMA 3.1 8B (Fast)": "llama-3.1-8b-instant",
+    "LLaMA 3.3 70B (Powerful)": "llama-3.3-70b-versatile",
+    "Qwen 3 32B": "qwen/qwen3-32b",
+}
+
+DEFAULT_MODEL = "llama-3.1-8b-instant"
+
+# Prompt token budget per model, kept well under the free-tier tokens-per-minute limits
+MODEL_CONTEXT_BUDGETS = {
+    "llama-3.1-8b-instant": 4000,
+    "llama-3.3-70b-versatile": 8000,
+    "qwen/qwen3-32b": 4000,
+}
+
+DEFAULT_CONTEXT_BUDGET = 4000
+
+# Tokens reserved for the completion (matches max_tokens in the request)
+MAX_COMPLETION_TOKENS = 1024
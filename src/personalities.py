@@ -2,6 +2,18 @@
 Personality definitions and system prompts for the chatbot
 """
 
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from src.context import estimate_tokens
+
+PERSONALITY_FILE_EXTENSIONS = (".json", ".yaml", ".yml")
+DEFAULT_REFUSE_MESSAGE = "I can't answer that question."
+
 PERSONALITIES = {
     "Math Teacher": {
         "description": "Only answers math-related questions. Will politely refuse non-math topics.",
@@ -142,3 +154,170 @@ def get_personality_keywords(personality, personalities_dict):
 def get_refuse_message(personality, personalities_dict):
     """Get the refusal message for a specific personality"""
     return personalities_dict[personality]["refuse_message"]
+
+
+def compile_system_prompt(personality: str, personality_info: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build a personality's system message once, with its content hash and token count.
+
+    Args:
+        personality: Personality name
+        personality_info: The personality's definition
+
+    Returns:
+        Dictionary with 'name', 'message' (the API system message), 'hash'
+        (sha256 of the message content) and 'tokens' keys
+    """
+    content = personality_info["system_prompt"]
+    return {
+        "name": personality,
+        "message": {"role": "system", "content": content},
+        "hash": hashlib.sha256(content.encode("utf-8")).hexdigest(),
+        "tokens": estimate_tokens(content),
+    }
+
+
+def _normalize_personality(personality: str, personality_info: Dict[str, Any], source: str) -> Dict[str, Any]:
+    """Validate a personality read from a file and fill in optional fields"""
+    if not isinstance(personality_info, dict) or not isinstance(personality_info.get("system_prompt"), str):
+        raise ValueError(f"{source}: personality '{personality}' needs a 'system_prompt' string")
+    return {
+        "description": personality_info.get("description", ""),
+        # Line endings are normalized so the prompt hash does not depend on the platform
+        "system_prompt": personality_info["system_prompt"].replace("\r\n", "\n"),
+        "keywords": list(personality_info.get("keywords", [])),
+        "refuse_message": personality_info.get("refuse_message", DEFAULT_REFUSE_MESSAGE),
+    }
+
+
+def load_personality_file(path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Read personalities from a JSON or YAML file.
+
+    A file holds either one personality (named by its 'name' field or the
+    file name) or a mapping of personality names to definitions.
+
+    Args:
+        path: Path to a .json, .yaml or .yml file
+
+    Returns:
+        Dictionary of personality name to definition
+    """
+    with open(path, encoding="utf-8") as handle:
+        if path.endswith(".json"):
+            data = json.load(handle)
+        else:
+            import yaml
+            data = yaml.safe_load(handle)
+
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: expected a mapping")
+    if "system_prompt" in data:
+        name = data.get("name") or os.path.splitext(os.path.basename(path))[0]
+        return {name: _normalize_personality(name, data, path)}
+    return {name: _normalize_personality(name, info, path) for name, info in data.items()}
+
+
+def load_personality_directory(directory: str) -> Dict[str, Dict[str, Any]]:
+    """Read every personality file in a directory, in file name order"""
+    personalities = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(PERSONALITY_FILE_EXTENSIONS):
+            personalities.update(load_personality_file(os.path.join(directory, filename)))
+    return personalities
+
+
+class PromptRegistry:
+    """
+    Precompiled system prompts for every personality.
+
+    Each personality's system message is built once and the same string is
+    sent on every request, so the prompt prefix stays byte-identical and
+    providers can reuse it. Caches key on the prompt hash instead of the raw
+    text. Personalities can also be loaded from a directory of JSON/YAML
+    files, which is checked for changes at most every ``reload_interval``
+    seconds; a file that fails to parse keeps the previous definitions.
+    """
+
+    def __init__(self, personalities_dict: Optional[Dict[str, Any]] = None, directory: Optional[str] = None,
+                 reload_interval: float = 2.0):
+        self.base = dict(PERSONALITIES if personalities_dict is None else personalities_dict)
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.version = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._signature = None
+        self._checked = 0.0
+        self._personalities = {}
+        self._compiled = {}
+        self._install(self.base)
+        if directory:
+            self.reload()
+
+    def _install(self, personalities_dict: Dict[str, Any]) -> None:
+        # Unchanged prompts keep their compiled entry, so their message string is reused as is
+        compiled = {}
+        for name, info in personalities_dict.items():
+            previous = self._compiled.get(name)
+            if previous is not None and previous["message"]["content"] == info["system_prompt"]:
+                compiled[name] = previous
+            else:
+                compiled[name] = compile_system_prompt(name, info)
+        self._personalities = personalities_dict
+        self._names = list(personalities_dict)
+        self._compiled = compiled
+        self.version += 1
+
+    def _directory_signature(self):
+        return tuple(
+            (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+            for entry in sorted(os.scandir(self.directory), key=lambda entry: entry.name)
+            if entry.name.endswith(PERSONALITY_FILE_EXTENSIONS)
+        )
+
+    def reload(self) -> bool:
+        """
+        Re-read the personality directory if any file changed.
+
+        Returns:
+            True if the personalities were replaced
+        """
+        if not self.directory:
+            return False
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                signature = self._directory_signature()
+                if signature == self._signature:
+                    return False
+                loaded = load_personality_directory(self.directory)
+            except Exception as e:
+                # Missing directory, invalid JSON/YAML or no YAML parser installed
+                self.last_error = f"{type(e).__name__}: {e}"
+                return False
+            self._signature = signature
+            self.last_error = None
+            self._install({**self.base, **loaded})
+            return True
+
+    def _maybe_reload(self) -> None:
+        if self.directory and time.monotonic() - self._checked >= self.reload_interval:
+            self.reload()
+
+    @property
+    def personalities(self) -> Dict[str, Any]:
+        """Current personality definitions (built-in plus loaded from the directory)"""
+        self._maybe_reload()
+        return self._personalities
+
+    @property
+    def names(self) -> List[str]:
+        """Personality names in display order"""
+        self._maybe_reload()
+        return self._names
+
+    def get(self, personality: str) -> Dict[str, Any]:
+        """Get a personality's compiled system prompt (see compile_system_prompt)"""
+        self._maybe_reload()
+        return self._compiled[personality]
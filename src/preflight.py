@@ -0,0 +1,175 @@
+"""
+Local pre-flight refusal gate that runs before the Groq API is called
+"""
+
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+ALLOW = "allow"
+REFUSE = "refuse"
+UNCERTAIN = "uncertain"
+
+
+def preflight_check(user_input: str, personality: str, personalities_dict: Dict[str, Any],
+                    classifier=None) -> Dict[str, Any]:
+    """
+    Decide locally whether a prompt needs the LLM at all.
+
+    A prompt is only refused when it misses the selected personality's domain
+    and clearly belongs to another one: with the keyword heuristic, that
+    other domain needs real domain-term hits (see domain_match_scores), so
+    generic stems like "what is" or a bare number never cause a refusal.
+    Everything else that misses the domain (greetings, follow-ups like
+    "and then?") is uncertain and goes to the LLM.
+
+    Args:
+        user_input: The user's message
+        personality: The selected personality
+        personalities_dict: Dictionary of all personalities
+        classifier: Optional SemanticClassifier used instead of the keyword heuristic
+
+    Returns:
+        Dictionary with 'decision' (allow/refuse/uncertain) and 'response' (str) keys
+    """
+    if personality not in personalities_dict:
+        return {"decision": UNCERTAIN, "response": ""}
+
+    # Personalities added after the classifier was built fall back to keywords
+    if classifier is not None and classifier.column(personality) is not None:
+        predicted = classifier.predict(user_input)
+        in_domain = predicted == personality
+        other_domain = predicted is not None and not in_domain
+    else:
+        # Imported here so the keyword index is only loaded once the gate is used
+        from src.utils import classify_all, domain_match_scores
+        in_domain = classify_all(user_input, personalities_dict)[personality]
+        other_domain = not in_domain and any(
+            hits for name, hits in domain_match_scores(user_input, personalities_dict).items() if name != personality
+        )
+
+    if in_domain:
+        return {"decision": ALLOW, "response": ""}
+
+    if other_domain:
+        refuse_message = personalities_dict[personality].get("refuse_message", "I can't answer that question.")
+        return {"decision": REFUSE, "response": refuse_message}
+
+    return {"decision": UNCERTAIN, "response": ""}
+
+
+class PreflightStats:
+    """Process-wide counters for the pre-flight gate"""
+
+    def __init__(self, smoothing: float = 0.2):
+        self._lock = threading.Lock()
+        self._smoothing = smoothing
+        self.checks = 0
+        self.decisions = {ALLOW: 0, REFUSE: 0, UNCERTAIN: 0}
+        self.speculative_refusals = 0
+        self.check_seconds = 0.0
+        self.avg_upstream_seconds = None
+        self.latency_saved_seconds = 0.0
+        self.speculation: Dict[str, Dict[str, Any]] = {}
+
+    def record_check(self, decision: str, seconds: float, speculative: bool = False) -> None:
+        """
+        Record one pre-flight decision and how long the local check took.
+
+        A speculative refusal is counted separately: its Groq request was
+        already open, so it neither avoided a call nor saved latency.
+        """
+        with self._lock:
+            self.checks += 1
+            self.check_seconds += seconds
+            if speculative and decision == REFUSE:
+                self.speculative_refusals += 1
+                return
+            self.decisions[decision] += 1
+            if decision == REFUSE and self.avg_upstream_seconds is not None:
+                self.latency_saved_seconds += max(self.avg_upstream_seconds - seconds, 0.0)
+
+    def record_speculation(self, personality: str, decision: str, check_seconds: float,
+                           wasted_prompt_tokens: int = 0, wasted_tokens: int = 0,
+                           wasted_seconds: float = 0.0) -> None:
+        """
+        Record the outcome of a speculative request.
+
+        Args:
+            personality: The selected personality
+            decision: The boundary check's verdict
+            check_seconds: Check latency, hidden behind the upstream request unless it refused
+            wasted_prompt_tokens: Prompt tokens of the upstream request a refusal cancelled
+            wasted_tokens: Streamed chunks (approximate tokens) received and thrown away
+            wasted_seconds: Time the cancelled upstream request was open
+        """
+        with self._lock:
+            entry = self.speculation.get(personality)
+            if entry is None:
+                entry = self.speculation[personality] = {
+                    "requests": 0, "refused": 0, "hidden_check_seconds": 0.0,
+                    "wasted_prompt_tokens": 0, "wasted_tokens": 0, "wasted_seconds": 0.0,
+                }
+            entry["requests"] += 1
+            if decision == REFUSE:
+                entry["refused"] += 1
+                entry["wasted_prompt_tokens"] += wasted_prompt_tokens
+                entry["wasted_tokens"] += wasted_tokens
+                entry["wasted_seconds"] += wasted_seconds
+            else:
+                entry["hidden_check_seconds"] += check_seconds
+
+    def record_upstream(self, seconds: float) -> None:
+        """Record the latency of a completed Groq call (moving average)"""
+        with self._lock:
+            if self.avg_upstream_seconds is None:
+                self.avg_upstream_seconds = seconds
+            else:
+                self.avg_upstream_seconds += self._smoothing * (seconds - self.avg_upstream_seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a copy of the counters"""
+        with self._lock:
+            return {
+                "checks": self.checks,
+                "avoided_calls": self.decisions[REFUSE],
+                "allowed": self.decisions[ALLOW],
+                "uncertain": self.decisions[UNCERTAIN],
+                "speculative_refusals": self.speculative_refusals,
+                "avg_check_ms": (self.check_seconds / self.checks * 1000) if self.checks else 0.0,
+                "avg_upstream_seconds": self.avg_upstream_seconds,
+                "latency_saved_seconds": self.latency_saved_seconds,
+                "speculation": {name: dict(entry) for name, entry in self.speculation.items()},
+            }
+
+
+PREFLIGHT_STATS = PreflightStats()
+
+
+def parse_speculation_policy(value: Optional[str]) -> frozenset:
+    """
+    Parse a comma-separated list of personalities that use speculative pre-flight.
+
+    "*" enables it for every personality; empty or None disables it.
+    """
+    return frozenset(name.strip() for name in (value or "").split(",") if name.strip())
+
+
+def is_speculative(policy: Iterable[str], personality: str) -> bool:
+    """Whether a personality's pre-flight check runs concurrently with its Groq request"""
+    return "*" in policy or personality in policy
+
+
+def run_preflight(user_input: str, personality: str, personalities_dict: Dict[str, Any],
+                  stats: PreflightStats = PREFLIGHT_STATS, classifier: Optional[Any] = None,
+                  speculative: bool = False) -> Dict[str, Any]:
+    """
+    Run preflight_check and record the outcome in stats; the result also carries the check's 'seconds'.
+
+    ``speculative`` marks a check that ran while the Groq request was already open.
+    """
+    start = time.perf_counter()
+    result = preflight_check(user_input, personality, personalities_dict, classifier)
+    result["seconds"] = time.perf_counter() - start
+    stats.record_check(result["decision"], result["seconds"], speculative)
+    return result
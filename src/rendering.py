@@ -0,0 +1,118 @@
+"""
+Throttled incremental markdown rendering for streamed responses
+"""
+
+import time
+from typing import Any, Dict
+
+CURSOR = "▌"
+CODE_FENCE = "```"
+PARAGRAPH_BREAK = "\n\n"
+
+
+class StreamRenderer:
+    """
+    Render a streamed response without redrawing it on every chunk.
+
+    Chunks are collected in a list and flushed to the page at most every
+    ``min_interval`` seconds or every ``max_pending_chunks`` chunks. Finished
+    paragraphs are frozen into their own element, so each flush only re-sends
+    the paragraph still being written instead of the whole response. Breaks
+    inside fenced code blocks are never used as freeze points.
+
+    The container is any object with an ``empty()`` method returning a
+    placeholder with ``markdown()``, e.g. ``st.container()``.
+    """
+
+    def __init__(self, container, min_interval: float = 0.05, max_pending_chunks: int = 20,
+                 freeze_paragraphs: bool = True, cursor: str = CURSOR, clock=time.perf_counter):
+        self.container = container
+        self.min_interval = min_interval
+        self.max_pending_chunks = max_pending_chunks
+        self.freeze_paragraphs = freeze_paragraphs
+        self.cursor = cursor
+        self._clock = clock
+
+        self._parts = []
+        self._live_parts = []
+        self._pending_chunks = 0
+        self._frozen_fences = 0
+        self._last_flush = None
+        self._slot = None
+
+        self.chunks = 0
+        self.render_calls = 0
+        self.chars_rendered = 0
+        self.frozen_blocks = 0
+
+    def write(self, chunk: str) -> None:
+        """Add a chunk and flush if the time or size cadence is due"""
+        if not chunk:
+            return
+        self._parts.append(chunk)
+        self._live_parts.append(chunk)
+        self._pending_chunks += 1
+        self.chunks += 1
+
+        now = self._clock()
+        if (self._last_flush is None or now - self._last_flush >= self.min_interval
+                or self._pending_chunks >= self.max_pending_chunks):
+            self.flush(now)
+
+    def flush(self, now: float = None) -> None:
+        """Render pending chunks now"""
+        self._pending_chunks = 0
+        self._last_flush = self._clock() if now is None else now
+        live_text = "".join(self._live_parts)
+        if self.freeze_paragraphs:
+            live_text = self._freeze_finished_paragraphs(live_text)
+        self._render(live_text + self.cursor)
+
+    def finish(self) -> str:
+        """Render the final text without the cursor and return the full response"""
+        self._render("".join(self._live_parts))
+        return self.text
+
+    @property
+    def text(self) -> str:
+        """The full response received so far"""
+        return "".join(self._parts)
+
+    def stats(self) -> Dict[str, Any]:
+        """Render instrumentation for the current response"""
+        return {
+            "chunks": self.chunks,
+            "render_calls": self.render_calls,
+            "chars_rendered": self.chars_rendered,
+            "frozen_blocks": self.frozen_blocks,
+        }
+
+    def _freeze_finished_paragraphs(self, live_text: str) -> str:
+        """Move completed paragraphs into their own element and return the remainder"""
+        search_end = len(live_text)
+        while True:
+            boundary = live_text.rfind(PARAGRAPH_BREAK, 0, search_end)
+            if boundary <= 0:
+                return live_text
+            head = live_text[:boundary]
+            fences = self._frozen_fences + head.count(CODE_FENCE)
+            if fences % 2 == 0:
+                break
+            # Break is inside a code block; try an earlier one
+            search_end = boundary
+
+        self._render(head)
+        self._frozen_fences = fences
+        self.frozen_blocks += 1
+        self._slot = None
+
+        remainder = live_text[boundary + len(PARAGRAPH_BREAK):]
+        self._live_parts = [remainder] if remainder else []
+        return remainder
+
+    def _render(self, text: str) -> None:
+        if self._slot is None:
+            self._slot = self.container.empty()
+        self._slot.markdown(text)
+        self.render_calls += 1
+        self.chars_rendered += len(text)
@@ -0,0 +1,182 @@
+"""
+Adaptive model router that picks a Groq model by live latency and load
+"""
+
+import random
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from src.models import DEFAULT_MODEL, MODEL_CONTEXT_BUDGETS, MODEL_OPTIONS
+
+AUTO_MODEL = "auto"
+
+# Starting estimates before any live measurements exist (seconds, tokens/sec)
+MODEL_PRIORS = {
+    "llama-3.1-8b-instant": {"ttft": 0.3, "tokens_per_second": 500.0},
+    "llama-3.3-70b-versatile": {"ttft": 0.5, "tokens_per_second": 250.0},
+    "qwen/qwen3-32b": {"ttft": 0.4, "tokens_per_second": 350.0},
+}
+DEFAULT_PRIOR = {"ttft": 0.5, "tokens_per_second": 250.0}
+
+
+class ModelStats:
+    """Rolling latency, throughput and error statistics for one model"""
+
+    def __init__(self, model: str, smoothing: float):
+        prior = MODEL_PRIORS.get(model, DEFAULT_PRIOR)
+        self.model = model
+        self.smoothing = smoothing
+        self.ttft = prior["ttft"]
+        self.tokens_per_second = prior["tokens_per_second"]
+        self.error_rate = 0.0
+        self.error_updated = time.monotonic()
+        self.in_flight = 0
+        self.requests = 0
+        self.consecutive_errors = 0
+        self.unhealthy_until = 0.0
+
+    def _blend(self, current: float, sample: float) -> float:
+        return current + self.smoothing * (sample - current)
+
+    def decay_errors(self, now: float, half_life: float) -> None:
+        """Let the error rate fade with time, so old failures stop counting against the model"""
+        if half_life > 0 and now > self.error_updated:
+            self.error_rate *= 0.5 ** ((now - self.error_updated) / half_life)
+        self.error_updated = now
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "ttft": self.ttft,
+            "tokens_per_second": self.tokens_per_second,
+            "error_rate": self.error_rate,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "healthy": time.monotonic() >= self.unhealthy_until,
+        }
+
+
+class ModelRouter:
+    """
+    Route requests among the configured models.
+
+    Each model's expected latency is its smoothed time-to-first-token plus
+    the time to stream the expected reply at its smoothed tokens/sec,
+    inflated by its error rate and current in-flight load. Models whose
+    context budget is smaller than the prompt are skipped, and a model
+    that fails repeatedly is taken out of rotation for a cooldown period.
+    One router is shared by every session in the process.
+
+    A model is only measured when it is chosen, so the error rate halves
+    every ``error_half_life`` seconds and choose() sends an ``explore``
+    share of requests to another healthy model. That way a model that has
+    recovered from errors, or got faster, gets back into rotation.
+    """
+
+    def __init__(self, models: Optional[Iterable[str]] = None, smoothing: float = 0.2,
+                 expected_reply_tokens: int = 300, load_penalty: float = 0.15,
+                 failure_threshold: int = 3, cooldown: float = 30.0,
+                 error_half_life: float = 60.0, explore: float = 0.05, rng: Optional[random.Random] = None):
+        self.smoothing = smoothing
+        self.expected_reply_tokens = expected_reply_tokens
+        self.load_penalty = load_penalty
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.error_half_life = error_half_life
+        self.explore = explore
+        self._random = rng or random.Random()
+        self._lock = threading.Lock()
+        self._stats = {model: ModelStats(model, smoothing) for model in (models or MODEL_OPTIONS.values())}
+
+    def _stats_for(self, model: str) -> ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = ModelStats(model, self.smoothing)
+        return stats
+
+    def _score(self, stats: ModelStats) -> float:
+        expected = stats.ttft + self.expected_reply_tokens / max(stats.tokens_per_second, 1.0)
+        expected *= 1.0 + self.load_penalty * stats.in_flight
+        return expected / max(1.0 - stats.error_rate, 0.05)
+
+    def ranked(self, prompt_tokens: int = 0, exclude: Iterable[str] = ()) -> List[str]:
+        """
+        Order models from best to worst for a prompt.
+
+        Args:
+            prompt_tokens: Estimated prompt size, used to skip models whose budget is too small
+            exclude: Models not to consider (e.g. ones that just failed)
+
+        Returns:
+            Model ids, healthy models first, each group sorted by expected latency
+        """
+        now = time.monotonic()
+        excluded = set(exclude)
+        with self._lock:
+            candidates = [stats for model, stats in self._stats.items() if model not in excluded]
+            fitting = [stats for stats in candidates
+                       if MODEL_CONTEXT_BUDGETS.get(stats.model, prompt_tokens) >= prompt_tokens]
+            candidates = fitting or candidates
+            for stats in candidates:
+                stats.decay_errors(now, self.error_half_life)
+            candidates.sort(key=lambda stats: (stats.unhealthy_until > now, self._score(stats)))
+            return [stats.model for stats in candidates]
+
+    def choose(self, prompt_tokens: int = 0, exclude: Iterable[str] = ()) -> str:
+        """Pick the best model for a prompt, or now and then another healthy one to re-measure it"""
+        ranked = self.ranked(prompt_tokens, exclude)
+        if not ranked:
+            return DEFAULT_MODEL
+        if len(ranked) > 1 and self._random.random() < self.explore:
+            now = time.monotonic()
+            with self._lock:
+                healthy = [model for model in ranked[1:] if self._stats[model].unhealthy_until <= now]
+            if healthy:
+                return self._random.choice(healthy)
+        return ranked[0]
+
+    def record_start(self, model: str) -> None:
+        with self._lock:
+            stats = self._stats_for(model)
+            stats.in_flight += 1
+            stats.requests += 1
+
+    def record_success(self, model: str, ttft: float, tokens: int, stream_seconds: float) -> None:
+        """Record a completed stream: time to first token and streaming throughput"""
+        with self._lock:
+            stats = self._stats_for(model)
+            stats.in_flight = max(0, stats.in_flight - 1)
+            stats.ttft = stats._blend(stats.ttft, ttft)
+            if tokens > 1 and stream_seconds > 0:
+                stats.tokens_per_second = stats._blend(stats.tokens_per_second, tokens / stream_seconds)
+            stats.decay_errors(time.monotonic(), self.error_half_life)
+            stats.error_rate = stats._blend(stats.error_rate, 0.0)
+            stats.consecutive_errors = 0
+            stats.unhealthy_until = 0.0
+
+    def record_error(self, model: str) -> None:
+        with self._lock:
+            stats = self._stats_for(model)
+            stats.in_flight = max(0, stats.in_flight - 1)
+            stats.decay_errors(time.monotonic(), self.error_half_life)
+            stats.error_rate = stats._blend(stats.error_rate, 1.0)
+            stats.consecutive_errors += 1
+            if stats.consecutive_errors >= self.failure_threshold:
+                stats.unhealthy_until = time.monotonic() + self.cooldown
+
+    def record_cancel(self, model: str) -> None:
+        """Release a request that was cancelled without a verdict on the model"""
+        with self._lock:
+            stats = self._stats_for(model)
+            stats.in_flight = max(0, stats.in_flight - 1)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            for stats in self._stats.values():
+                stats.decay_errors(now, self.error_half_life)
+            return [stats.snapshot() for stats in self._stats.values()]
+
+
+MODEL_ROUTER = ModelRouter()
@@ -0,0 +1,260 @@
+"""
+CPU-only semantic domain classifier using hashed n-gram TF-IDF centroids
+
+Each personality's keywords, description and system prompt are turned into
+hashed word and character n-gram TF-IDF vectors and averaged into one unit
+centroid per personality. A message is scored by cosine similarity against
+every centroid at once. A message belongs to the best-scoring personality
+only when that score clears a floor and beats the runner-up by a margin;
+otherwise the classifier abstains. Requires NumPy.
+"""
+
+import hashlib
+import json
+import os
+import re
+import zlib
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_DIMENSIONS = 2 ** 15
+CHAR_NGRAM_SIZES = (3, 4, 5)
+KEYWORD_WEIGHT = 3.0
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Prompt boilerplate shared by every personality; it says nothing about the domain
+_BOILERPLATE_PATTERN = re.compile(
+    r"(you are|core behavior|personality:|strict boundary|remember:|for non-|important medical)", re.IGNORECASE
+)
+
+# Words that appear in almost any question and would otherwise pull every centroid together
+STOP_WORDS = frozenset("""
+a about an and any are as at be but by can could do does for from get give has have how i if in is it its
+me my of on or please should so tell that the their them there these they this to was what when where which
+who why will with would you your
+""".split())
+
+
+def _hash(feature: str, dimensions: int) -> int:
+    return zlib.crc32(feature.encode("utf-8")) % dimensions
+
+
+def extract_features(text: str, dimensions: int = DEFAULT_DIMENSIONS) -> Dict[int, float]:
+    """
+    Hash a text's word unigrams/bigrams and character n-grams into term counts.
+
+    Args:
+        text: Input text
+        dimensions: Size of the hashed feature space
+
+    Returns:
+        Dictionary mapping feature index to raw count
+    """
+    words = [word for word in _WORD_PATTERN.findall(text.lower()) if word not in STOP_WORDS]
+    counts = {}
+    for index, word in enumerate(words):
+        features = ["w:" + word]
+        if index:
+            features.append("b:" + words[index - 1] + " " + word)
+        padded = f" {word} "
+        for size in CHAR_NGRAM_SIZES:
+            features.extend("c:" + padded[start:start + size] for start in range(len(padded) - size + 1))
+        for feature in features:
+            slot = _hash(feature, dimensions)
+            counts[slot] = counts.get(slot, 0.0) + 1.0
+    return counts
+
+
+def _personality_documents(personality_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Split a personality definition into weighted training documents"""
+    documents = [{"text": keyword, "weight": KEYWORD_WEIGHT} for keyword in personality_info.get("keywords", [])]
+    documents.append({"text": personality_info.get("description", ""), "weight": 1.0})
+    for line in personality_info.get("system_prompt", "").splitlines():
+        line = line.strip(" -")
+        if line and not _BOILERPLATE_PATTERN.search(line):
+            documents.append({"text": line, "weight": 1.0})
+    return documents
+
+
+def personalities_fingerprint(personalities_dict: Dict[str, Any]) -> str:
+    """Stable hash of the personality definitions a classifier was built from"""
+    payload = json.dumps(
+        {name: [info.get("keywords", []), info.get("description", ""), info.get("system_prompt", "")]
+         for name, info in sorted(personalities_dict.items())},
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SemanticClassifier:
+    """Scores messages against per-personality TF-IDF centroids"""
+
+    def __init__(self, names: List[str], centroids, idf, dimensions: int = DEFAULT_DIMENSIONS,
+                 fingerprint: str = "", min_score: float = 0.06, margin: float = 1.2):
+        self.names = list(names)
+        self.centroids = centroids
+        self.idf = idf
+        self.dimensions = dimensions
+        self.fingerprint = fingerprint
+        self.min_score = min_score
+        self.margin = margin
+        self._column = {name: index for index, name in enumerate(self.names)}
+
+    @classmethod
+    def build(cls, personalities_dict: Dict[str, Any], dimensions: int = DEFAULT_DIMENSIONS,
+              **decision_rule) -> "SemanticClassifier":
+        """
+        Compute the IDF table and one centroid per personality.
+
+        Args:
+            personalities_dict: Dictionary of all personalities
+            dimensions: Size of the hashed feature space
+
+        Returns:
+            SemanticClassifier instance
+        """
+        names = list(personalities_dict)
+        per_personality = []
+        document_frequency = np.zeros(dimensions, dtype=np.float64)
+        total_documents = 0
+        for name in names:
+            documents = []
+            for document in _personality_documents(personalities_dict[name]):
+                counts = extract_features(document["text"], dimensions)
+                if counts:
+                    documents.append((counts, document["weight"]))
+                    document_frequency[list(counts)] += 1
+                    total_documents += 1
+            per_personality.append(documents)
+
+        idf = np.log((1.0 + total_documents) / (1.0 + document_frequency)) + 1.0
+        centroids = np.zeros((len(names), dimensions), dtype=np.float32)
+        for row, documents in enumerate(per_personality):
+            for counts, weight in documents:
+                indices = np.fromiter(counts, dtype=np.int64, count=len(counts))
+                values = (1.0 + np.log(np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))) * idf[indices]
+                norm = np.linalg.norm(values)
+                if norm:
+                    np.add.at(centroids[row], indices, (weight * values / norm).astype(np.float32))
+            norm = np.linalg.norm(centroids[row])
+            if norm:
+                centroids[row] /= norm
+
+        return cls(names, centroids, idf.astype(np.float32), dimensions,
+                   personalities_fingerprint(personalities_dict), **decision_rule)
+
+    def save(self, directory: str) -> None:
+        """Write the centroids and IDF table as .npy files plus a JSON manifest"""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "centroids.npy"), np.asarray(self.centroids))
+        np.save(os.path.join(directory, "idf.npy"), np.asarray(self.idf))
+        with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as handle:
+            json.dump({
+                "names": self.names,
+                "dimensions": self.dimensions,
+                "fingerprint": self.fingerprint,
+                "min_score": self.min_score,
+                "margin": self.margin,
+            }, handle, indent=2)
+
+    @classmethod
+    def load(cls, directory: str) -> "SemanticClassifier":
+        """Load a saved classifier, memory-mapping the centroid and IDF arrays"""
+        with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as handle:
+            manifest = json.load(handle)
+        return cls(
+            manifest["names"],
+            np.load(os.path.join(directory, "centroids.npy"), mmap_mode="r"),
+            np.load(os.path.join(directory, "idf.npy"), mmap_mode="r"),
+            manifest["dimensions"],
+            manifest["fingerprint"],
+            manifest["min_score"],
+            manifest["margin"],
+        )
+
+    def score_batch(self, texts: Sequence[str]):
+        """
+        Cosine similarity of each text to each personality centroid.
+
+        Args:
+            texts: Messages to score
+
+        Returns:
+            float32 array of shape (len(texts), number of personalities)
+        """
+        indices, values, offsets = [], [], []
+        for text in texts:
+            offsets.append(len(indices))
+            counts = extract_features(text, self.dimensions)
+            indices.extend(counts)
+            values.extend(counts.values())
+
+        scores = np.zeros((len(texts), len(self.names)), dtype=np.float32)
+        if not indices:
+            return scores
+
+        indices = np.asarray(indices, dtype=np.int64)
+        weights = (1.0 + np.log(np.asarray(values, dtype=np.float32))) * self.idf[indices]
+        offsets = np.asarray(offsets, dtype=np.int64)
+        lengths = np.diff(np.append(offsets, len(indices)))
+        non_empty = lengths > 0
+
+        norms = np.sqrt(np.add.reduceat(weights * weights, offsets[non_empty]))
+        contributions = np.asarray(self.centroids)[:, indices] * weights
+        scores[non_empty] = (np.add.reduceat(contributions, offsets[non_empty], axis=1) / norms).T
+        return scores
+
+    def score(self, text: str) -> Dict[str, float]:
+        """Score one message; returns personality name -> similarity"""
+        return dict(zip(self.names, self.score_batch([text])[0].tolist()))
+
+    def predict_batch(self, texts: Sequence[str]):
+        """
+        Assign each text to one personality, or abstain.
+
+        Args:
+            texts: Messages to classify
+
+        Returns:
+            int array of personality column indices, -1 where the classifier abstains
+        """
+        scores = self.score_batch(texts)
+        if len(self.names) < 2:
+            return np.where(scores[:, 0] >= self.min_score, 0, -1) if len(self.names) else np.full(len(texts), -1)
+        top_two = np.sort(scores, axis=1)[:, -2:]
+        best = scores.argmax(axis=1)
+        confident = (top_two[:, 1] >= self.min_score) & (top_two[:, 1] >= self.margin * top_two[:, 0])
+        return np.where(confident, best, -1)
+
+    def predict(self, text: str) -> Optional[str]:
+        """Name of the personality a message belongs to, or None when unsure"""
+        column = int(self.predict_batch([text])[0])
+        return self.names[column] if column >= 0 else None
+
+    def column(self, personality: str) -> Optional[int]:
+        return self._column.get(personality)
+
+
+def load_or_build_classifier(personalities_dict: Dict[str, Any], directory: str) -> SemanticClassifier:
+    """
+    Load the saved classifier artifact, rebuilding it when personalities changed.
+
+    Args:
+        personalities_dict: Dictionary of all personalities
+        directory: Where the artifact lives
+
+    Returns:
+        SemanticClassifier instance
+    """
+    fingerprint = personalities_fingerprint(personalities_dict)
+    try:
+        classifier = SemanticClassifier.load(directory)
+        if classifier.fingerprint == fingerprint:
+            return classifier
+    except (OSError, ValueError, KeyError):
+        pass
+    classifier = SemanticClassifier.build(personalities_dict)
+    classifier.save(directory)
+    return SemanticClassifier.load(directory)
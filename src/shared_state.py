@@ -0,0 +1,371 @@
+"""
+Shared state for running several app replicas behind a load balancer
+
+Conversation history, response cache entries and the Groq keys' rate-limit
+buckets normally live inside each process. With a shared state backend
+every replica reads and writes them in one place, so any replica can serve
+any session and the replicas together stay within each key's limits:
+
+- ``sqlite:///path/to/state.db``: one SQLite file (WAL, file locking) on a
+  disk all replicas can reach; suits several processes on one host and tests
+- ``redis://host:6379/0``: Redis or a Redis-compatible server (needs the
+  ``redis`` package)
+
+Request coalescing, the model router and metrics stay per replica.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.cache import SQLiteCacheBackend
+from src.context import make_message
+from src.store import ConversationStore
+
+
+def _text(value) -> str:
+    """Redis clients return bytes unless created with decode_responses"""
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class SharedKeyRateLimiter:
+    """
+    Rate limits of one API key kept in a shared store.
+
+    Same interface as client_pool.KeyRateLimiter. Each try_acquire() is a
+    single transaction (SQLite) or script (Redis) that refills both
+    buckets, and takes from them only if both have enough, so racing
+    replicas never overshoot a key's limits. The balances seen by the last
+    call are kept for the pool's key ordering and stats without more I/O.
+    """
+
+    # Store I/O: the pool runs try_acquire in a worker thread
+    blocking = True
+
+    def __init__(self, store, name: str, requests_per_minute: float, tokens_per_minute: float):
+        self.store = store
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_available = requests_per_minute
+        self.tokens_available = tokens_per_minute
+
+    def try_acquire(self, cost: int) -> float:
+        """Take one request and ``cost`` tokens if both are available; else return seconds to wait"""
+        wait, self.requests_available, self.tokens_available = self.store.try_take(
+            self.name, self.requests_per_minute, self.tokens_per_minute, cost
+        )
+        return wait
+
+
+def _refill(tokens: Optional[float], updated: Optional[float], capacity: float, now: float) -> float:
+    """Balance of a bucket refilled at ``capacity`` per minute since it was last written"""
+    if tokens is None:
+        return capacity
+    return min(capacity, tokens + max(0.0, now - updated) * capacity / 60.0)
+
+
+class SQLiteBucketStore:
+    """Rate-limit bucket balances in a SQLite file, updated under its write lock"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def limiter(self, name: str, requests_per_minute: float, tokens_per_minute: float) -> SharedKeyRateLimiter:
+        return SharedKeyRateLimiter(self, name, requests_per_minute, tokens_per_minute)
+
+    def try_take(self, name: str, requests_per_minute: float, tokens_per_minute: float,
+                 cost: float) -> Tuple[float, float, float]:
+        """
+        Refill a key's buckets and take one request and ``cost`` tokens if both suffice.
+
+        Returns:
+            (seconds to wait, 0 if taken; requests left; tokens left)
+        """
+        now = time.time()
+        buckets = [(f"{name}:requests", requests_per_minute, 1.0), (f"{name}:tokens", tokens_per_minute, cost)]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                wait, balances = 0.0, []
+                for bucket, capacity, amount in buckets:
+                    row = self._conn.execute("SELECT tokens, updated FROM rate_buckets WHERE name = ?",
+                                             (bucket,)).fetchone()
+                    tokens = _refill(*(row or (None, None)), capacity, now)
+                    amount = min(amount, capacity)
+                    if tokens < amount:
+                        wait = max(wait, (amount - tokens) * 60.0 / capacity if capacity > 0 else float("inf"))
+                    balances.append((bucket, tokens, amount))
+                if wait == 0.0:
+                    balances = [(bucket, tokens - amount, amount) for bucket, tokens, amount in balances]
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO rate_buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                        [(bucket, tokens, now) for bucket, tokens, _ in balances],
+                    )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return wait, balances[0][1], balances[1][1]
+
+
+# Refill both buckets of a key and take from them only if both suffice, in one atomic step;
+# balances expire once they would be full again anyway
+_REDIS_LIMITER_SCRIPT = """
+local now, wait = tonumber(ARGV[3]), 0
+local capacities = {tonumber(ARGV[1]), tonumber(ARGV[2])}
+local amounts = {1, tonumber(ARGV[4])}
+local balances = {}
+for i = 1, 2 do
+    local capacity = capacities[i]
+    local rate = math.max(capacity / 60, 1e-9)
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'updated')
+    local tokens = capacity
+    if state[1] then
+        tokens = math.min(capacity, tonumber(state[1]) + math.max(0, now - tonumber(state[2])) * rate)
+    end
+    amounts[i] = math.min(amounts[i], capacity)
+    if tokens < amounts[i] then
+        wait = math.max(wait, (amounts[i] - tokens) / rate)
+    end
+    balances[i] = tokens
+end
+if wait == 0 then
+    for i = 1, 2 do
+        balances[i] = balances[i] - amounts[i]
+        redis.call('HSET', KEYS[i], 'tokens', tostring(balances[i]), 'updated', tostring(now))
+        redis.call('EXPIRE', KEYS[i], math.ceil((capacities[i] - balances[i]) / math.max(capacities[i] / 60, 1e-9)) + 60)
+    end
+end
+return {tostring(wait), tostring(balances[1]), tostring(balances[2])}
+"""
+
+
+class RedisBucketStore:
+    """Rate-limit bucket balances in Redis, updated by a server-side script"""
+
+    def __init__(self, client, prefix: str = "chatbot"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(_REDIS_LIMITER_SCRIPT)
+
+    def limiter(self, name: str, requests_per_minute: float, tokens_per_minute: float) -> SharedKeyRateLimiter:
+        return SharedKeyRateLimiter(self, name, requests_per_minute, tokens_per_minute)
+
+    def try_take(self, name: str, requests_per_minute: float, tokens_per_minute: float,
+                 cost: float) -> Tuple[float, float, float]:
+        """Same as SQLiteBucketStore.try_take, in one script call"""
+        keys = [f"{self.prefix}:bucket:{name}:requests", f"{self.prefix}:bucket:{name}:tokens"]
+        wait, requests, tokens = self._script(keys=keys, args=[requests_per_minute, tokens_per_minute,
+                                                               time.time(), cost])
+        return float(wait), float(requests), float(tokens)
+
+
+class RedisCacheBackend:
+    """
+    Response cache entries in Redis with a TTL and LRU eviction.
+
+    A sorted set of keys by last access keeps the entry count at
+    ``max_entries``, like SQLiteCacheBackend.
+    """
+
+    # Network I/O: the engine calls it from a worker thread
+    blocking = True
+
+    def __init__(self, client, prefix: str = "chatbot", max_entries: int = 1000, ttl: float = 3600.0):
+        self.client = client
+        self.prefix = prefix
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._index = f"{prefix}:cache-index"
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:cache:{key}"
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(self._key(key))
+        if value is None:
+            self.client.zrem(self._index, key)
+            return None
+        self.client.zadd(self._index, {key: time.time()})
+        return _text(value)
+
+    def set(self, key: str, value: str) -> None:
+        pipeline = self.client.pipeline()
+        pipeline.set(self._key(key), value, ex=max(1, int(self.ttl)))
+        pipeline.zadd(self._index, {key: time.time()})
+        pipeline.execute()
+        excess = self.client.zcard(self._index) - self.max_entries
+        if excess > 0:
+            evicted = [_text(member) for member, _ in self.client.zpopmin(self._index, excess)]
+            if evicted:
+                self.client.delete(*(self._key(member) for member in evicted))
+
+    def clear(self) -> None:
+        keys = self.client.zrange(self._index, 0, -1)
+        pipeline = self.client.pipeline()
+        for member in keys:
+            pipeline.delete(self._key(_text(member)))
+        pipeline.delete(self._index)
+        pipeline.execute()
+
+    def __len__(self) -> int:
+        return self.client.zcard(self._index)
+
+
+# Write a summary only while the session still has the last message it covers
+_REDIS_SUMMARY_SCRIPT = """
+if redis.call('LLEN', KEYS[1]) > tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[2], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+class RedisConversationStore:
+    """
+    Conversation history in Redis, with the ConversationStore interface.
+
+    Each session is a Redis list of JSON messages; a message's sequence
+    number is its index in the list, so appends from different replicas
+    never collide. The rolling summary is stored under its own key.
+    """
+
+    # Network I/O: the engine calls it from a worker thread
+    blocking = True
+
+    def __init__(self, client, prefix: str = "chatbot", window: int = 50):
+        self.client = client
+        self.prefix = prefix
+        self.window = window
+        self._set_summary = client.register_script(_REDIS_SUMMARY_SCRIPT)
+
+    def _messages_key(self, session_id: str) -> str:
+        return f"{self.prefix}:messages:{session_id}"
+
+    def _summary_key(self, session_id: str) -> str:
+        return f"{self.prefix}:summary:{session_id}"
+
+    @staticmethod
+    def _decode(raw, seq: int) -> Dict[str, Any]:
+        message = json.loads(raw)
+        message["seq"] = seq
+        return message
+
+    def append(self, session_id: str, role: str, content: str) -> Dict[str, Any]:
+        """Append a message to a session and return it with its 'seq'"""
+        message = make_message(role, content)
+        message["seq"] = self.client.rpush(self._messages_key(session_id), json.dumps(message)) - 1
+        return message
+
+    def recent(self, session_id: str) -> List[Dict[str, Any]]:
+        """Get the latest ``window`` messages of a session, oldest first"""
+        pipeline = self.client.pipeline()
+        pipeline.llen(self._messages_key(session_id))
+        pipeline.lrange(self._messages_key(session_id), -self.window, -1)
+        length, rows = pipeline.execute()
+        start = length - len(rows)
+        return [self._decode(raw, start + offset) for offset, raw in enumerate(rows)]
+
+    def load_older(self, session_id: str, before_seq: int, limit: int = 20) -> List[Dict[str, Any]]:
+        """Read messages older than ``before_seq``, oldest first"""
+        if before_seq <= 0:
+            return []
+        start = max(0, before_seq - limit)
+        rows = self.client.lrange(self._messages_key(session_id), start, before_seq - 1)
+        return [self._decode(raw, start + offset) for offset, raw in enumerate(rows)]
+
+    def has_older(self, session_id: str, before_seq: int) -> bool:
+        """Check whether a session has messages before ``before_seq``"""
+        return before_seq > 0 and bool(self.load_older(session_id, before_seq, limit=1))
+
+    def get_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get a session's rolling summary, or None"""
+        raw = self.client.get(self._summary_key(session_id))
+        return json.loads(raw) if raw is not None else None
+
+    def set_summary(self, session_id: str, summary: Dict[str, Any], through_seq: int) -> Optional[Dict[str, Any]]:
+        """Replace a session's rolling summary, if the session still has message ``through_seq``"""
+        summary = {"role": "system", "content": summary["content"], "tokens": summary["tokens"],
+                   "through_seq": through_seq}
+        stored = self._set_summary(keys=[self._messages_key(session_id), self._summary_key(session_id)],
+                                   args=[through_seq, json.dumps(summary)])
+        return summary if int(stored) else None
+
+    def clear(self, *session_ids: str) -> None:
+        """Delete the history and summary of one or more sessions"""
+        if session_ids:
+            self.client.delete(*(key for session_id in session_ids
+                                 for key in (self._messages_key(session_id), self._summary_key(session_id))))
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.client.close()
+
+
+class SharedState:
+    """
+    Builds the replica-shared store, cache backend and rate-limit buckets for a URL.
+
+    Args:
+        url: ``sqlite:///path/to/state.db`` or ``redis://host:port/db``
+        prefix: Namespace for Redis keys, so several apps can share a server
+        client: Existing Redis-compatible client to use instead of connecting to ``url``
+    """
+
+    def __init__(self, url: str, prefix: str = "chatbot", client=None):
+        self.url = url
+        self.prefix = prefix
+        if url.startswith("sqlite:///"):
+            self.kind = "sqlite"
+            self.path = url[len("sqlite:///"):]
+            self.client = None
+        elif url.startswith(("redis://", "rediss://", "unix://")):
+            self.kind = "redis"
+            self.path = None
+            if client is None:
+                import redis
+                client = redis.Redis.from_url(url)
+            self.client = client
+        else:
+            raise ValueError(f"Unsupported shared state URL: {url}")
+        self._buckets = None
+
+    def conversation_store(self, window: int = 50):
+        """ConversationStore (shared mode) or RedisConversationStore"""
+        if self.kind == "sqlite":
+            return ConversationStore(self.path, window=window, shared=True)
+        return RedisConversationStore(self.client, self.prefix, window)
+
+    def cache_backend(self, max_entries: int = 1000, ttl: float = 3600.0):
+        """Backend for ResponseCache shared by every replica"""
+        if self.kind == "sqlite":
+            return SQLiteCacheBackend(self.path, max_entries=max_entries, ttl=ttl)
+        return RedisCacheBackend(self.client, self.prefix, max_entries, ttl)
+
+    @property
+    def limiter_factory(self) -> Callable[[str, float, float], SharedKeyRateLimiter]:
+        """``limiter_factory`` for GroqClientPool"""
+        if self._buckets is None:
+            self._buckets = SQLiteBucketStore(self.path) if self.kind == "sqlite" else \
+                RedisBucketStore(self.client, self.prefix)
+        return self._buckets.limiter
+
+
+def create_shared_state(url: Optional[str]) -> Optional[SharedState]:
+    """Build the shared state for a URL, or None when it is unset"""
+    if not url:
+        return None
+    return SharedState(url)
@@ -0,0 +1,319 @@
+"""
+Append-only conversation store with a bounded in-memory window per session
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+from src.context import make_message
+
+_STOP = object()
+
+
+class ConversationStore:
+    """
+    Conversation history backed by an append-only SQLite log (WAL mode).
+
+    Only the most recent ``window`` messages of each session are kept in
+    memory, and only for the ``max_sessions`` most recently used sessions.
+    Older turns are read back on demand with load_older(). Each session
+    can also hold one rolling summary of its older turns (see
+    set_summary()), stored next to the messages and deleted with them.
+    Writes are queued and committed in batches by a background thread, so
+    appending never waits on disk I/O.
+
+    With ``shared=True`` several processes (app replicas) can use the same
+    database file: nothing is cached between calls, writes are committed
+    before they return and sequence numbers are allocated inside the write
+    transaction, so any replica can serve any session. Calls then wait on
+    disk I/O, which ``blocking`` tells the engine to keep off its event loop.
+    """
+
+    def __init__(self, path: str = ":memory:", window: int = 50, max_sessions: int = 1000,
+                 batch_size: int = 200, flush_interval: float = 0.1, shared: bool = False):
+        self.path = path
+        self.shared = shared
+        self.blocking = shared
+        self.window = window
+        self.max_sessions = max_sessions
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # Other processes may hold the write lock briefly; wait for it instead of failing
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        self._db_lock = threading.Lock()
+        with self._db_lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "session_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, "
+                "tokens INTEGER NOT NULL, created REAL NOT NULL, PRIMARY KEY (session_id, seq))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "session_id TEXT PRIMARY KEY, content TEXT NOT NULL, tokens INTEGER NOT NULL, "
+                "through_seq INTEGER NOT NULL, created REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = queue.Queue()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop, name="conversation-store", daemon=True)
+        self._writer.start()
+
+    def _load_session(self, session_id: str) -> Dict[str, Any]:
+        """Get a session's in-memory state, reading its latest window from disk if needed"""
+        state = None if self.shared else self._sessions.get(session_id)
+        if state is not None:
+            self._sessions.move_to_end(session_id)
+            return state
+
+        # Writes for this session may still be queued if it was just evicted
+        if self._pending.get(session_id):
+            self.flush()
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT seq, role, content, tokens FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+                (session_id, self.window)
+            ).fetchall()
+            summary_row = self._conn.execute(
+                "SELECT content, tokens, through_seq FROM summaries WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        messages = [self._row_to_message(row) for row in reversed(rows)]
+        state = {
+            "window": deque(messages, maxlen=self.window),
+            "next_seq": messages[-1]["seq"] + 1 if messages else 0,
+            "summary": None,
+        }
+        if summary_row is not None:
+            content, tokens, through_seq = summary_row
+            state["summary"] = {"role": "system", "content": content, "tokens": tokens, "through_seq": through_seq}
+        if self.shared:
+            return state
+        self._sessions[session_id] = state
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return state
+
+    @staticmethod
+    def _row_to_message(row) -> Dict[str, Any]:
+        seq, role, content, tokens = row
+        return {"role": role, "content": content, "tokens": tokens, "seq": seq}
+
+    def append(self, session_id: str, role: str, content: str) -> Dict[str, Any]:
+        """
+        Append a message to a session.
+
+        Args:
+            session_id: Identifier of the conversation
+            role: 'user' or 'assistant'
+            content: Message content
+
+        Returns:
+            The stored message, with 'role', 'content', 'tokens' and 'seq' keys
+        """
+        if self.shared:
+            return self._append_shared(session_id, make_message(role, content))
+        with self._lock:
+            state = self._load_session(session_id)
+            message = make_message(role, content)
+            message["seq"] = state["next_seq"]
+            state["next_seq"] += 1
+            state["window"].append(message)
+            # Queued under the lock so writes reach the disk in the order they were made in memory
+            self._enqueue(("append", session_id, message, time.time()))
+        return message
+
+    def _append_shared(self, session_id: str, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Insert a message with the next free sequence number in one write transaction"""
+        with self._db_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                message["seq"] = self._conn.execute(
+                    "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?", (session_id,)
+                ).fetchone()[0]
+                self._conn.execute(
+                    "INSERT INTO messages (session_id, seq, role, content, tokens, created) VALUES (?, ?, ?, ?, ?, ?)",
+                    (session_id, message["seq"], message["role"], message["content"], message["tokens"], time.time())
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return message
+
+    def recent(self, session_id: str) -> List[Dict[str, Any]]:
+        """Get the in-memory window of a session, oldest first"""
+        with self._lock:
+            return list(self._load_session(session_id)["window"])
+
+    def load_older(self, session_id: str, before_seq: int, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Read messages older than ``before_seq`` from disk, oldest first.
+
+        Args:
+            session_id: Identifier of the conversation
+            before_seq: Sequence number of the oldest message already shown
+            limit: Maximum number of messages to return
+        """
+        self.flush()
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT seq, role, content, tokens FROM messages WHERE session_id = ? AND seq < ? "
+                "ORDER BY seq DESC LIMIT ?",
+                (session_id, before_seq, limit)
+            ).fetchall()
+        return [self._row_to_message(row) for row in reversed(rows)]
+
+    def has_older(self, session_id: str, before_seq: int) -> bool:
+        """Check whether a session has messages before ``before_seq``"""
+        return before_seq > 0 and bool(self.load_older(session_id, before_seq, limit=1))
+
+    def get_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a session's rolling summary.
+
+        Returns:
+            Summary message with 'role', 'content', 'tokens' and 'through_seq'
+            (the last message it covers), or None
+        """
+        with self._lock:
+            return self._load_session(session_id)["summary"]
+
+    def set_summary(self, session_id: str, summary: Dict[str, Any], through_seq: int) -> Optional[Dict[str, Any]]:
+        """
+        Replace a session's rolling summary, if the session still has message ``through_seq``.
+
+        A summary computed before the session was cleared would otherwise
+        cover (and hide) messages of the new conversation.
+
+        Args:
+            session_id: Identifier of the conversation
+            summary: Message dictionary with 'content' and 'tokens'
+            through_seq: Sequence number of the last message the summary covers
+
+        Returns:
+            The stored summary, or None if the session no longer has that message
+        """
+        summary = {"role": "system", "content": summary["content"], "tokens": summary["tokens"],
+                   "through_seq": through_seq}
+        if self.shared:
+            return self._set_summary_shared(session_id, summary)
+        with self._lock:
+            state = self._load_session(session_id)
+            # Messages are only ever deleted together with their session, which resets next_seq
+            if through_seq >= state["next_seq"]:
+                return None
+            state["summary"] = summary
+            self._enqueue(("summary", session_id, summary, time.time()))
+        return summary
+
+    def _set_summary_shared(self, session_id: str, summary: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Write a summary in one transaction with the check that its last message still exists"""
+        with self._db_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                exists = self._conn.execute(
+                    "SELECT 1 FROM messages WHERE session_id = ? AND seq = ?", (session_id, summary["through_seq"])
+                ).fetchone()
+                if exists is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO summaries (session_id, content, tokens, through_seq, created) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (session_id, summary["content"], summary["tokens"], summary["through_seq"], time.time())
+                    )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return summary if exists is not None else None
+
+    def clear(self, *session_ids: str) -> None:
+        """Delete the history and summary of one or more sessions"""
+        with self._lock:
+            for session_id in session_ids:
+                self._sessions.pop(session_id, None)
+                self._enqueue(("clear", session_id, None, None))
+        self.flush()
+
+    def flush(self) -> None:
+        """Wait until every queued write is on disk"""
+        self._writes.join()
+
+    def close(self) -> None:
+        self._writes.put(_STOP)
+        self._writer.join()
+        with self._db_lock:
+            self._conn.close()
+
+    def _enqueue(self, item) -> None:
+        if self.shared:
+            self._write_batch([item])
+            return
+        session_id = item[1]
+        with self._pending_lock:
+            self._pending[session_id] = self._pending.get(session_id, 0) + 1
+        self._writes.put(item)
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._writes.get()
+            batch = [item]
+            # Collect whatever else arrives shortly after, up to batch_size
+            deadline = time.monotonic() + self.flush_interval
+            while item is not _STOP and len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._writes.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            writes = [entry for entry in batch if entry is not _STOP]
+            try:
+                self._write_batch(writes)
+            finally:
+                with self._pending_lock:
+                    for entry in writes:
+                        remaining = self._pending.get(entry[1], 1) - 1
+                        if remaining > 0:
+                            self._pending[entry[1]] = remaining
+                        else:
+                            self._pending.pop(entry[1], None)
+                for _ in batch:
+                    self._writes.task_done()
+            if batch[-1] is _STOP:
+                return
+
+    def _write_batch(self, batch) -> None:
+        if not batch:
+            return
+        with self._db_lock:
+            for operation, session_id, message, created in batch:
+                if operation == "append":
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO messages (session_id, seq, role, content, tokens, created) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (session_id, message["seq"], message["role"], message["content"], message["tokens"], created)
+                    )
+                elif operation == "summary":
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO summaries (session_id, content, tokens, through_seq, created) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (session_id, message["content"], message["tokens"], message["through_seq"], created)
+                    )
+                else:
+                    self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                    self._conn.execute("DELETE FROM summaries WHERE session_id = ?", (session_id,))
+            self._conn.commit()
@@ -0,0 +1,87 @@
+"""
+Rolling conversation summaries that keep long sessions' prompts small
+"""
+
+from typing import Any, Dict, List, Optional
+
+from src.context import make_message
+from src.models import DEFAULT_MODEL
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Update the existing summary with the new messages. Keep facts, names, numbers, the user's goals "
+    "and open questions; drop small talk. Write at most {words} words of plain prose and reply with "
+    "the updated summary only."
+)
+
+
+class ConversationSummarizer:
+    """
+    Fold older turns of a session into a rolling summary with a small model.
+
+    Once the messages not yet covered by the summary exceed
+    ``threshold_tokens``, all but the latest ``keep_recent`` of them are
+    summarized together with the previous summary, so each update only
+    sends the new turns rather than the whole conversation. The engine
+    runs updates in the background after a reply has finished.
+    """
+
+    def __init__(self, client, model: str = DEFAULT_MODEL, threshold_tokens: int = 1500,
+                 keep_recent: int = 6, max_tokens: int = 300):
+        self.client = client
+        self.model = model
+        self.threshold_tokens = threshold_tokens
+        self.keep_recent = keep_recent
+        self.max_tokens = max_tokens
+
+    def pending(self, history: List[Dict[str, Any]], summary: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Pick the messages the next summary update should fold in.
+
+        Args:
+            history: Recent messages of the session, oldest first, with 'seq'
+            summary: The session's current summary, if any
+
+        Returns:
+            Messages to summarize, oldest first; empty if the unsummarized
+            history is still under the threshold
+        """
+        through_seq = summary["through_seq"] if summary is not None else -1
+        unsummarized = [message for message in history if message["seq"] > through_seq]
+        if sum(message["tokens"] for message in unsummarized) <= self.threshold_tokens:
+            return []
+        return unsummarized[:max(0, len(unsummarized) - self.keep_recent)]
+
+    async def summarize(self, previous: Optional[str], messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Produce the updated summary text.
+
+        Args:
+            previous: Current summary text, or None for the first summary
+            messages: New messages to fold in, oldest first
+
+        Returns:
+            Message dictionary ('role', 'content', 'tokens') holding the new summary
+        """
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS.format(words=int(self.max_tokens * 0.6))},
+                {"role": "user", "content": f"Existing summary:\n{previous or '(none)'}\n\nNew messages:\n{transcript}"},
+            ],
+            temperature=0.2,
+            max_tokens=self.max_tokens,
+        )
+        content = (response.choices[0].message.content or "").strip()
+        if not content:
+            raise ValueError("Summary model returned an empty summary")
+        return make_message("system", content)
+
+
+def create_conversation_summarizer(client, threshold_tokens: int, model: str = DEFAULT_MODEL,
+                                   keep_recent: int = 6) -> Optional[ConversationSummarizer]:
+    """Build a summarizer, or None when the threshold is zero or unset"""
+    if not threshold_tokens or threshold_tokens <= 0:
+        return None
+    return ConversationSummarizer(client, model, threshold_tokens, keep_recent)
@@ -3,13 +3,156 @@ Utility functions for personality boundary enforcement
 """
 
 import re
-from typing import Dict, Any
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
+
+MATH_EXPRESSION_PATTERN = re.compile(r'[\d\+\-\*/\(\)\^=]+')
+
+# An actual operation between numbers, unlike MATH_EXPRESSION_PATTERN which matches any digit
+MATH_OPERATION_PATTERN = re.compile(r'\d\s*[\+\-\*/\^=]\s*\d')
+
+# Punctuation stripped before keyword matching (math operators are kept)
+_PUNCTUATION_TABLE = str.maketrans('', '', '?!.,;:\'"()')
+
+# Additional semantic check using common phrases
+COMMON_PHRASES = {
+    "Math Teacher": ["how do i", "solve", "calculate", "what is", "explain", "problem",
+                     "simplify", "factor", "expand", "derivative", "integral", "equals",
+                     "plus", "minus", "times", "divided", "formula", "equation"],
+    "Doctor": ["i have", "symptoms", "feeling", "health", "should i", "do i have",
+               "pain", "fever", "sick", "disease", "medical", "treatment", "medicine",
+               "doctor", "illness", "condition", "cure"],
+    "Travel Guide": ["where should", "best place", "how to get", "visit", "trip", "vacation",
+                     "travel", "destination", "hotel", "flight", "tour", "sightseeing",
+                     "country", "city", "airport", "recommend"],
+    "Chef": ["recipe", "how to make", "cooking", "ingredients", "prepare", "cook", "bake",
+             "dish", "food", "meal", "sauce", "ingredient", "seasoning", "taste", "flavor"],
+    "Tech Support": ["error", "not working", "how to fix", "install", "setup", "problem",
+                     "crash", "bug", "computer", "software", "hardware", "debug", "troubleshoot",
+                     "code", "program", "network", "connection"]
+}
+
+# Question stems shared by every domain; they say nothing about which personality fits best
+GENERIC_PHRASES = {"how do i", "what is", "explain", "problem", "i have", "should i", "do i have", "feeling"}
+
+# Extra domain terms that only rank personalities for fan-out; the boundary check does not use them
+RANKING_TERMS = {
+    "Chef": ["breakfast", "lunch", "dinner"],
+}
+
+# Compiled matchers, keyed by id() of the personalities dict they were built from. Only the most
+# recently used few are kept: prompt registry reloads create a new dict each time
+_INDEX_CACHE: "OrderedDict[int, Tuple[Dict[str, Any], Dict[str, Any]]]" = OrderedDict()
+_INDEX_CACHE_SIZE = 4
 
 
 def is_math_expression(user_input: str) -> bool:
     """Check if input contains math expressions or operators"""
-    math_pattern = r'[\d\+\-\*/\(\)\^=]+'
-    return bool(re.search(math_pattern, user_input))
+    return bool(MATH_EXPRESSION_PATTERN.search(user_input))
+
+
+def clean_input(user_input: str) -> str:
+    """Lowercase the input and strip punctuation the boundary check ignores"""
+    return user_input.lower().translate(_PUNCTUATION_TABLE)
+
+
+def _compile_terms(terms: List[str]) -> Optional[Pattern]:
+    """Build a single alternation regex matching any of the terms as a substring"""
+    unique_terms = sorted({term.lower() for term in terms if term}, key=len, reverse=True)
+    if not unique_terms:
+        return None
+    return re.compile("|".join(re.escape(term) for term in unique_terms))
+
+
+def _compile_word_terms(terms) -> Optional[Pattern]:
+    """Build a regex matching any of the terms at the start of a word"""
+    ordered = sorted(terms, key=len, reverse=True)
+    if not ordered:
+        return None
+    return re.compile(r"\b(?:" + "|".join(map(re.escape, ordered)) + ")")
+
+
+def build_boundary_index(personalities_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Precompile one matcher per personality from its keywords and common phrases.
+
+    Args:
+        personalities_dict: Dictionary of all personalities
+
+    Returns:
+        Dictionary mapping personality name to its compiled matcher info
+    """
+    index = {}
+    for personality, personality_info in personalities_dict.items():
+        terms = list(personality_info.get("keywords", [])) + COMMON_PHRASES.get(personality, [])
+        domain_terms = {term.lower() for term in terms if term and term.lower() not in GENERIC_PHRASES}
+        index[personality] = {
+            "pattern": _compile_terms(terms),
+            # Domain-specific terms only, matched at word starts, for judging and ranking relevance
+            "domain_pattern": _compile_word_terms(domain_terms),
+            "ranking_pattern": _compile_word_terms(domain_terms | set(RANKING_TERMS.get(personality, []))),
+            "math": personality == "Math Teacher",
+            "refuse_message": personality_info.get("refuse_message", "I can't answer that question."),
+        }
+    return index
+
+
+def get_boundary_index(personalities_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the compiled matcher for a personalities dict, building it on first use"""
+    key = id(personalities_dict)
+    cached = _INDEX_CACHE.get(key)
+    if cached is not None and cached[0] is personalities_dict:
+        _INDEX_CACHE.move_to_end(key)
+        return cached[1]
+    index = build_boundary_index(personalities_dict)
+    _INDEX_CACHE[key] = (personalities_dict, index)
+    _INDEX_CACHE.move_to_end(key)
+    while len(_INDEX_CACHE) > _INDEX_CACHE_SIZE:
+        _INDEX_CACHE.popitem(last=False)
+    return index
+
+
+def clear_boundary_index_cache() -> None:
+    """Drop compiled matchers, e.g. after editing a personalities dict in place"""
+    _INDEX_CACHE.clear()
+
+
+def domain_match_scores(user_input: str, personalities_dict: Dict[str, Any],
+                        ranking: bool = False) -> Dict[str, int]:
+    """
+    Count how strongly a message matches each personality's domain.
+
+    Unlike classify_all, generic question stems ("how do i", "what is") do
+    not count and a bare number is not math; only distinct domain terms and
+    (for the Math Teacher) an actual arithmetic operation do.
+
+    Args:
+        user_input: The user's message
+        personalities_dict: Dictionary of all personalities
+        ranking: Also count RANKING_TERMS, for ordering fan-out personalities
+
+    Returns:
+        Dictionary mapping each personality name to its number of distinct domain hits
+    """
+    cleaned = clean_input(user_input)
+    scores = {}
+    for personality, entry in get_boundary_index(personalities_dict).items():
+        pattern = entry["ranking_pattern" if ranking else "domain_pattern"]
+        hits = len(set(pattern.findall(cleaned))) if pattern is not None else 0
+        if entry["math"] and MATH_OPERATION_PATTERN.search(user_input):
+            hits += 1
+        scores[personality] = hits
+    return scores
+
+
+def _matches(entry: Dict[str, Any], original_input: str, cleaned_input: str) -> bool:
+    """Check one compiled personality entry against a prepared message"""
+    pattern = entry["pattern"]
+    if pattern is not None and pattern.search(cleaned_input):
+        return True
+    # Special handling for Math Teacher - check for math expressions
+    return entry["math"] and bool(MATH_EXPRESSION_PATTERN.search(original_input))
 
 
 def enforce_personality_boundary(user_input: str, personality: str, personalities_dict: Dict[str, Any]) -> Dict[str, Any]:
@@ -24,83 +167,41 @@ def enforce_personality_boundary(user_input: str, personality: str, personalitie
     Returns:
         Dictionary with 'allowed' (bool) and 'response' (str) keys
     """
-
-    if personality not in personalities_dict:
+    entry = get_boundary_index(personalities_dict).get(personality)
+    if entry is None:
         return {
             "allowed": False,
             "response": "Unknown personality selected."
         }
 
-    personality_info = personalities_dict[personality]
-    keywords = personality_info.get("keywords", [])
-    refuse_message = personality_info.get("refuse_message", "I can't answer that question.")
-
-    # Convert input to lowercase for comparison
-    user_input_lower = user_input.lower()
-
-    # Keep original for math detection
-    original_input = user_input
-
-    # Remove common punctuation for better matching (but keep math operators)
-    cleaned_input = re.sub(r'[?!.,;:\'"()]', '', user_input_lower)
-
-    # Split into words
-    words = cleaned_input.split()
-
-    # Check if any keyword is present in the user input
-    keyword_found = False
-    for keyword in keywords:
-        keyword_lower = keyword.lower()
-        # Check both whole words and partial word matches
-        if keyword_lower in cleaned_input or any(keyword_lower in word for word in words):
-            keyword_found = True
-            break
-
-    # If keywords found, allow the question
-    if keyword_found:
+    if _matches(entry, user_input, clean_input(user_input)):
         return {
             "allowed": True,
             "response": ""
         }
 
-    # Special handling for Math Teacher - check for math expressions
-    if personality == "Math Teacher":
-        if is_math_expression(original_input):
-            return {
-                "allowed": True,
-                "response": ""
-            }
-
-    # Additional semantic check using common phrases
-    common_phrases = {
-        "Math Teacher": ["how do i", "solve", "calculate", "what is", "explain", "problem",
-                        "simplify", "factor", "expand", "derivative", "integral", "equals",
-                        "plus", "minus", "times", "divided", "formula", "equation"],
-        "Doctor": ["i have", "symptoms", "feeling", "health", "should i", "do i have",
-                  "pain", "fever", "sick", "disease", "medical", "treatment", "medicine",
-                  "doctor", "illness", "condition", "cure"],
-        "Travel Guide": ["where should", "best place", "how to get", "visit", "trip", "vacation",
-                        "travel", "destination", "hotel", "flight", "tour", "sightseeing",
-                        "country", "city", "airport", "recommend"],
-        "Chef": ["recipe", "how to make", "cooking", "ingredients", "prepare", "cook", "bake",
-                "dish", "food", "meal", "sauce", "ingredient", "seasoning", "taste", "flavor"],
-        "Tech Support": ["error", "not working", "how to fix", "install", "setup", "problem",
-                        "crash", "bug", "computer", "software", "hardware", "debug", "troubleshoot",
-                        "code", "program", "network", "connection"]
+    # If no keywords or common phrases found, refuse the question
+    return {
+        "allowed": False,
+        "response": entry["refuse_message"]
     }
 
-    if personality in common_phrases:
-        for phrase in common_phrases[personality]:
-            if phrase in cleaned_input:
-                return {
-                    "allowed": True,
-                    "response": ""
-                }
 
-    # If no keywords or common phrases found, refuse the question
+def classify_all(user_input: str, personalities_dict: Dict[str, Any]) -> Dict[str, bool]:
+    """
+    Check one message against every personality, cleaning the input only once.
+
+    Args:
+        user_input: The user's message
+        personalities_dict: Dictionary of all personalities
+
+    Returns:
+        Dictionary mapping each personality name to whether the input is in its domain
+    """
+    cleaned_input = clean_input(user_input)
     return {
-        "allowed": False,
-        "response": refuse_message
+        personality: _matches(entry, user_input, cleaned_input)
+        for personality, entry in get_boundary_index(personalities_dict).items()
     }
 
 